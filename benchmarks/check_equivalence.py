@@ -0,0 +1,183 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from batch import byte_range_shards, clean_files_parallel, clean_shards_parallel
+from cache import load_cleaned_data_cached, quality_report_path
+from incremental import append_new_rows, rebuild_cleaned_data
+from processing import dependent_validation_rules, load_and_clean_data, validation_rules
+from quality import new_quality_report, read_quality_report, write_quality_report
+from schema import survey_schema
+from streaming import clean_csv_in_chunks
+from synthetic import generate_survey_data
+
+pd.set_option('future.no_silent_downcasting', True)
+
+coded_columns = [column for column_names, _ in validation_rules
+                 for column in ([column_names] if isinstance(column_names, str) else column_names)]
+
+
+# Synthetic surveys with the kinds of bad input the cleaning handles.
+def corrupted_survey(row_count, seed):
+    # Out-of-range codes in one answer in ten.
+    return generate_survey_data(row_count, seed, invalid_rate=0.1)
+
+
+def inconsistent_q9_survey(row_count, seed):
+    # Employment types given by respondents who said they have no salary,
+    # and none given by some who said they do.
+    survey_data = generate_survey_data(row_count, seed)
+    rng = np.random.default_rng(seed)
+    for column_to_validate, yes_no_column, range_of_answer in dependent_validation_rules:
+        answered_no = (survey_data[yes_no_column] == 0) & (rng.random(row_count) < 0.05)
+        survey_data.loc[answered_no, column_to_validate] = rng.choice(np.array(range_of_answer[1:]), answered_no.sum())
+        answered_yes = (survey_data[yes_no_column] == 1) & (rng.random(row_count) < 0.05)
+        survey_data.loc[answered_yes, column_to_validate] = -1
+    return survey_data
+
+
+def blank_answers_survey(row_count, seed):
+    # Answers left blank, written as empty fields.
+    survey_data = generate_survey_data(row_count, seed).astype({column: 'float64' for column in coded_columns})
+    rng = np.random.default_rng(seed)
+    for column in coded_columns:
+        survey_data.loc[rng.random(row_count) < 0.02, column] = np.nan
+    return survey_data
+
+
+surveys = {
+    'corrupted': corrupted_survey,
+    'inconsistent Q9': inconsistent_q9_survey,
+    'blank answers': blank_answers_survey,
+}
+
+
+def in_memory_output(input_path, output_path, report_path):
+    report = new_quality_report()
+    load_and_clean_data(input_path, report=report).to_csv(output_path, index=False)
+    write_quality_report(report, report_path)
+
+
+def streaming_output(input_path, output_path, report_path, chunksize):
+    clean_csv_in_chunks(input_path, output_path, chunksize, report_path)
+
+
+def shards_output(input_path, output_path, report_path, shard_count, workers):
+    clean_shards_parallel(byte_range_shards(input_path, shard_count), output_path, workers, report_path=report_path)
+
+
+def files_output(input_path, output_path, report_path, file_count, workers):
+    # The survey split into files of whole rows, each with the header.
+    survey_data = pd.read_csv(input_path, dtype=str, keep_default_na=False)
+    filepaths = []
+    for file_number, part in enumerate(np.array_split(np.arange(len(survey_data)), file_count)):
+        filepath = f"{input_path}.part{file_number}.csv"
+        survey_data.iloc[part].to_csv(filepath, index=False)
+        filepaths.append(filepath)
+    clean_files_parallel(filepaths, output_path, workers, report_path=report_path)
+
+
+def incremental_output(input_path, output_path, first_rows):
+    # The first rows cleaned on their own, then the rest appended. Rows
+    # cleaned before a mode moved are only right after a rebuild, so the
+    # columns reported stale are left out of the comparison.
+    with open(input_path, 'rb') as source_file:
+        lines = source_file.readlines()
+    partial_path = f"{input_path}.growing.csv"
+    state_path = f"{input_path}.state"
+    with open(partial_path, 'wb') as partial_file:
+        partial_file.writelines(lines[:first_rows + 1])
+    rebuild_cleaned_data(partial_path, output_path, state_path)
+    with open(partial_path, 'ab') as partial_file:
+        partial_file.writelines(lines[first_rows + 1:])
+    _, stale_columns = append_new_rows(partial_path, output_path, state_path)
+    return {survey_schema[column]['name'] for column in stale_columns}
+
+
+def cache_output(input_path, output_path, report_path, first_rows):
+    # The dashboard's categorical cache built from the first rows, then the
+    # rest appended. It cleans everything again when a mode moves, so no
+    # columns are left out.
+    with open(input_path, 'rb') as source_file:
+        lines = source_file.readlines()
+    partial_path = f"{input_path}.cached.csv"
+    cache_dir = f"{input_path}.cache"
+    with open(partial_path, 'wb') as partial_file:
+        partial_file.writelines(lines[:first_rows + 1])
+    load_cleaned_data_cached(partial_path, cache_dir, categorical=True)
+    with open(partial_path, 'ab') as partial_file:
+        partial_file.writelines(lines[first_rows + 1:])
+    load_cleaned_data_cached(partial_path, cache_dir, categorical=True).to_csv(output_path, index=False)
+    write_quality_report(read_quality_report(quality_report_path(partial_path, cache_dir, True)), report_path)
+
+
+def read_output(output_path):
+    # Compared as the text written, so formatting differences count too.
+    return pd.read_csv(output_path, dtype=str, keep_default_na=False)
+
+
+def differing_columns(expected, actual):
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return ['<shape>']
+    return [column for column in expected.columns if not expected[column].equals(actual[column])]
+
+
+def check_survey(name, survey_data, directory, args):
+    input_path = os.path.join(directory, f"{name.replace(' ', '_')}.csv")
+    survey_data.to_csv(input_path, index=False)
+
+    def path(kind, extension='csv'):
+        return os.path.join(directory, f"{name.replace(' ', '_')}.{kind}.{extension}")
+
+    in_memory_output(input_path, path('in_memory'), path('in_memory', 'json'))
+    streaming_output(input_path, path('streaming'), path('streaming', 'json'), args.chunksize)
+    shards_output(input_path, path('shards'), path('shards', 'json'), args.shards, args.workers)
+    files_output(input_path, path('files'), path('files', 'json'), args.files, args.workers)
+    stale_columns = incremental_output(input_path, path('incremental'), len(survey_data) // 2)
+    cache_output(input_path, path('cache'), path('cache', 'json'), len(survey_data) // 2)
+    rebuild_cleaned_data(input_path, path('rebuild'), path('rebuild', 'state'), args.chunksize)
+
+    expected = read_output(path('in_memory'))
+    expected_report = read_quality_report(path('in_memory', 'json'))
+    failures = 0
+    for kind in ('streaming', 'shards', 'files', 'incremental', 'cache', 'rebuild'):
+        actual = read_output(path(kind))
+        columns = differing_columns(expected, actual)
+        if kind == 'incremental':
+            columns = [column for column in columns if column not in stale_columns]
+        elif kind != 'rebuild' and read_quality_report(path(kind, 'json')) != expected_report:
+            columns.append('<quality report>')
+        note = f" (stale, not compared: {', '.join(sorted(stale_columns))})" if kind == 'incremental' and stale_columns else ""
+        print(f"{name:<18}{kind:<13}{'ok' if not columns else 'DIFFERS in ' + ', '.join(columns)}{note}")
+        failures += bool(columns)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the streaming, batch, incremental and cached cleaning paths "
+                                                 "write the same cleaned data as the in-memory path.")
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=3_000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--files', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for name, make_survey in surveys.items():
+            failures += check_survey(name, make_survey(args.rows, args.seed), directory, args)
+    if failures:
+        sys.exit(f"{failures} cleaning paths differ from the in-memory path")
+    print("Every cleaning path matches the in-memory path")
+
+
+if __name__ == '__main__':
+    main()
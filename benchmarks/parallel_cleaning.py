@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from batch import clean_files_parallel
+from processing import load_and_clean_data
+
+pd.set_option('future.no_silent_downcasting', True)
+
+
+def write_regional_files(input_path, directory, file_count, scale):
+    raw_data = pd.concat([pd.read_csv(input_path)] * scale, ignore_index=True)
+    filepaths = []
+    for file_number in range(file_count):
+        filepath = os.path.join(directory, f"region_{file_number}.csv")
+        raw_data.to_csv(filepath, index=False)
+        filepaths.append(filepath)
+    return filepaths, len(raw_data) * file_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how batch cleaning scales with worker processes.")
+    parser.add_argument('--input', default='data/training.csv')
+    parser.add_argument('--files', type=int, default=8, help="Number of regional files to clean")
+    parser.add_argument('--scale', type=int, default=5, help="Number of times to repeat the input rows in each file")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths, row_count = write_regional_files(args.input, directory, args.files, args.scale)
+        print(f"{args.files} files, {row_count} rows")
+
+        start = time.perf_counter()
+        for filepath in filepaths:
+            load_and_clean_data(filepath)
+        sequential_time = time.perf_counter() - start
+        print(f"{'sequential':<12}{sequential_time:>10.2f}s")
+
+        for workers in range(1, args.max_workers + 1):
+            start = time.perf_counter()
+            clean_files_parallel(filepaths, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>2} workers {elapsed:>10.2f}s  speedup {sequential_time / elapsed:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
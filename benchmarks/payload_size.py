@@ -0,0 +1,46 @@
+import argparse
+import gzip
+import os
+import sys
+
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from aggregates import build_aggregates
+from figures import figure_builders
+from payload import compact_figure, figure_patch, static_layout
+from processing import load_and_clean_data
+from run_benchmarks import benchmark_figure_arguments
+from schema import income_columns
+from spatial import default_grid_resolutions
+
+pd.set_option('future.no_silent_downcasting', True)
+
+# Same level as flask-compress uses by default.
+gzip_level = 6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the bytes sent for each graph update with and without compact payloads.")
+    parser.add_argument('--input', default='data/training.csv')
+    args = parser.parse_args()
+
+    cleaned_data = load_and_clean_data(args.input, categorical=True)
+    aggregates = build_aggregates(cleaned_data, income_columns, default_grid_resolutions)
+
+    print(f"{'graph':<35}{'full JSON':>12}{'full gzip':>12}{'compact':>12}{'compact gzip':>14}{'saved':>8}")
+    for name, arguments in benchmark_figure_arguments().items():
+        figure = figure_builders[name.split('[')[0]](aggregates, *arguments).to_dict()
+        full = to_json_plotly(figure).encode()
+        # An update to a page that already holds the graph's static layout.
+        compacted = compact_figure(figure)
+        compact = to_json_plotly(figure_patch(compacted, static_layout(compacted['layout']))).encode()
+        compact_gzip = len(gzip.compress(compact, gzip_level))
+        print(f"{name:<35}{len(full):>12}{len(gzip.compress(full, gzip_level)):>12}{len(compact):>12}{compact_gzip:>14}"
+              f"{1 - compact_gzip / len(full):>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
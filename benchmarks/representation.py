@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from processing import apply_validation_rules, relabel_columns
+from schema import financial_services
+
+pd.set_option('future.no_silent_downcasting', True)
+
+
+def time_filters(dataframe, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for financial_service in financial_services:
+            dataframe[dataframe['Mobile money classification'] == financial_service]
+    return (time.perf_counter() - start) / (repeats * len(financial_services))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the string and categorical cleaned frames.")
+    parser.add_argument('--input', default='data/training.csv')
+    parser.add_argument('--scale', type=int, default=10, help="Number of times to repeat the input rows")
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    raw_data = pd.read_csv(args.input)
+    raw_data = pd.concat([raw_data] * args.scale, ignore_index=True)
+    apply_validation_rules(raw_data)
+
+    print(f"{len(raw_data)} rows")
+    print(f"{'representation':<15}{'memory (MB)':>15}{'relabel (s)':>15}{'filter (ms)':>15}")
+    for name, categorical in [('string', False), ('categorical', True)]:
+        start = time.perf_counter()
+        cleaned_data = relabel_columns(raw_data.copy(), categorical)
+        relabel_time = time.perf_counter() - start
+        memory = cleaned_data.memory_usage(deep=True).sum() / 1e6
+        filter_time = time_filters(cleaned_data, args.repeats) * 1000
+        print(f"{name:<15}{memory:>15.1f}{relabel_time:>15.3f}{filter_time:>15.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import pandas as pd
+import plotly
+import plotly.io as pio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from aggregates import build_aggregates
+from figures import figure_builders
+from processing import (dependent_validation_rules, load_and_clean_data, relabel_columns,
+                        rule_name, save_cleaned_data, validate_column_keys, validate_if_answer_yes, validation_rules)
+from sampling import build_sample_aggregates
+from schema import income_columns, read_survey_csv
+from spatial import default_grid_resolutions
+from synthetic import write_survey_csv
+
+pd.set_option('future.no_silent_downcasting', True)
+
+default_row_counts = [10_000, 100_000, 1_000_000]
+financial_service = 'Uses both'
+cross_filters = (('Gender', ('Female',)), ('Highest level of education completed?', ('Some primary', 'Primary completed')),
+                 ('Ownership of land/plot', ()), ('Income source', ('Pension', 'Rental income')))
+sample_size = 20_000
+# Above this, the per-respondent map payload is too large to be a useful measurement.
+raw_map_max_rows = 1_000_000
+
+
+# Graph id -> figure arguments of one typical view; "[points]" marks the
+# per-respondent map.
+def benchmark_figure_arguments(include_points=True):
+    figure_arguments = {graph_id: (financial_service,) for graph_id in figure_builders}
+    figure_arguments['income-choropleth-map'] = (income_columns[1], default_grid_resolutions[0][1])
+    figure_arguments['cross-filter-graph'] = (cross_filters,)
+    if include_points:
+        figure_arguments['income-choropleth-map[points]'] = (income_columns[1],)
+    return figure_arguments
+
+
+def measure(function, *args, trace_memory=False):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    stats = {'seconds': round(time.perf_counter() - start, 6)}
+    if trace_memory:
+        stats['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 3)
+        tracemalloc.stop()
+    return result, stats
+
+
+def benchmark_cleaning(input_path, output_dir, trace_memory):
+    results = []
+
+    raw_data, stats = measure(read_survey_csv, input_path, trace_memory=trace_memory)
+    results.append({'stage': 'read_csv', **stats})
+
+    for column_names, range_of_keys in validation_rules:
+        _, stats = measure(validate_column_keys, raw_data, column_names, range_of_keys, trace_memory=trace_memory)
+        results.append({'stage': f"validate_column_keys[{rule_name(column_names)}]", **stats})
+    for column_to_validate, yes_no_column, range_of_answer in dependent_validation_rules:
+        _, stats = measure(validate_if_answer_yes, raw_data, column_to_validate, yes_no_column, range_of_answer, trace_memory=trace_memory)
+        results.append({'stage': f"validate_if_answer_yes[{column_to_validate}]", **stats})
+
+    for categorical in (False, True):
+        _, stats = measure(relabel_columns, raw_data.copy(), categorical, trace_memory=trace_memory)
+        results.append({'stage': f"relabel_columns[categorical={categorical}]", **stats})
+
+    cleaned_data, stats = measure(load_and_clean_data, input_path, trace_memory=trace_memory)
+    results.append({'stage': 'load_and_clean_data', **stats})
+
+    _, stats = measure(save_cleaned_data, cleaned_data, os.path.join(output_dir, 'cleaned.csv'), trace_memory=trace_memory)
+    results.append({'stage': 'save_cleaned_data', **stats})
+
+    return results
+
+
+def benchmark_figures(input_path, trace_memory):
+    results = []
+
+    cleaned_data = load_and_clean_data(input_path, categorical=True)
+    aggregates, stats = measure(build_aggregates, cleaned_data, income_columns, default_grid_resolutions, trace_memory=trace_memory)
+    results.append({'stage': 'build_aggregates', **stats})
+    sample_aggregates, stats = measure(build_sample_aggregates, cleaned_data, sample_size, income_columns, default_grid_resolutions,
+                                       trace_memory=trace_memory)
+    results.append({'stage': 'build_sample_aggregates', **stats})
+
+    figure_arguments = benchmark_figure_arguments(include_points=len(cleaned_data) <= raw_map_max_rows)
+
+    figure_runs = [(name, aggregates, arguments) for name, arguments in figure_arguments.items()]
+    figure_runs += [(f"{name}[sample]", sample_aggregates, arguments) for name, arguments in figure_arguments.items()]
+    for name, figure_aggregates, arguments in figure_runs:
+        figure_builder = figure_builders[name.split('[')[0]]
+        figure, build_stats = measure(figure_builder, figure_aggregates, *arguments, trace_memory=trace_memory)
+        payload, serialize_stats = measure(pio.to_json, figure, trace_memory=trace_memory)
+        results.append({
+            'stage': f"figure:{name}",
+            'seconds': build_stats['seconds'],
+            'serialize_seconds': serialize_stats['seconds'],
+            **({'peak_memory_mb': max(build_stats['peak_memory_mb'], serialize_stats['peak_memory_mb'])} if trace_memory else {}),
+            'payload_bytes': len(payload),
+        })
+
+    return results
+
+
+def run_benchmarks(input_path, output_dir, trace_memory):
+    return benchmark_cleaning(input_path, output_dir, trace_memory) + benchmark_figures(input_path, trace_memory)
+
+
+def compare_results(results, baseline, tolerance):
+    baseline_seconds = {(result['rows'], result['stage']): result['seconds'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        previous = baseline_seconds.get((result['rows'], result['stage']))
+        if previous and result['seconds'] > previous * (1 + tolerance) and result['seconds'] - previous > 0.001:
+            regressions.append((result['rows'], result['stage'], previous, result['seconds']))
+
+    for rows, stage, previous, current in regressions:
+        print(f"REGRESSION {rows:>10} rows  {stage}: {previous:.4f}s -> {current:.4f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cleaning pipeline and dashboard figures on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=default_row_counts,
+                        help="Dataset sizes to benchmark, up to 10000000")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--data-dir', default=None, help="Directory to keep the generated survey files in")
+    parser.add_argument('--baseline', default=None, help="Results file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown against the baseline")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="Skip the peak memory run")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        data_dir = args.data_dir or temporary_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        for row_count in args.rows:
+            input_path = os.path.join(data_dir, f"survey_{row_count}.csv")
+            if not os.path.exists(input_path):
+                write_survey_csv(input_path, row_count)
+
+            row_results = run_benchmarks(input_path, temporary_dir, trace_memory=False)
+            # Tracing slows the stages down, so peak memory comes from a
+            # second, traced run and the times from the untraced one.
+            if args.memory:
+                traced_results = run_benchmarks(input_path, temporary_dir, trace_memory=True)
+                for result, traced_result in zip(row_results, traced_results):
+                    result['peak_memory_mb'] = traced_result['peak_memory_mb']
+
+            for result in row_results:
+                result = {'rows': row_count, **result}
+                results.append(result)
+                memory = f"{result['peak_memory_mb']:>10.1f} MB" if 'peak_memory_mb' in result else ''
+                payload = f"  {result['payload_bytes']:>10} bytes" if 'payload_bytes' in result else ''
+                print(f"{row_count:>10} rows  {result['stage']:<55}{result['seconds']:>10.4f}s{memory}{payload}")
+
+    with open(args.output, 'w') as output_file:
+        json.dump({
+            'metadata': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'plotly': plotly.__version__,
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+            },
+            'results': results,
+        }, output_file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            if compare_results(results, json.load(baseline_file), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'source'))
+
+from processing import dependent_validation_rules, validation_rules
+from schema import survey_schema
+
+# Same columns, in the same order, as data/training.csv.
+survey_columns = list(survey_schema)
+
+# Share of coded answers replaced with an out-of-range code, so validation
+# and imputation have work to do.
+default_invalid_rate = 0.001
+
+
+def generate_survey_data(row_count, seed=0, first_id=1, invalid_rate=default_invalid_rate):
+    rng = np.random.default_rng(seed)
+    columns = {
+        "ID": np.arange(first_id, first_id + row_count),
+        "Q1": rng.integers(16, 101, row_count),
+        "Q2": rng.integers(1, 3, row_count),
+        "Latitude": rng.uniform(-11.5, -1.0, row_count),
+        "Longitude": rng.uniform(29.6, 40.3, row_count),
+    }
+
+    coded_columns = []
+    for column_names, range_of_keys in validation_rules:
+        for column in [column_names] if isinstance(column_names, str) else column_names:
+            columns[column] = rng.choice(np.array(list(range_of_keys)), row_count)
+            coded_columns.append(column)
+
+    # Dependent answers are consistent with their yes/no question: "no"
+    # answers get -1 (not applicable), "yes" answers a real code.
+    for column_to_validate, yes_no_column, range_of_answer in dependent_validation_rules:
+        answers = rng.choice(np.array(range_of_answer[1:]), row_count)
+        columns[column_to_validate] = np.where(columns[yes_no_column] == 1, answers, -1)
+
+    paired_columns = {column for column_to_validate, yes_no_column, _ in dependent_validation_rules
+                      for column in (column_to_validate, yes_no_column)}
+    for column in coded_columns:
+        if column not in paired_columns:
+            invalid = rng.random(row_count) < invalid_rate
+            columns[column] = np.where(invalid, 99, columns[column])
+
+    return pd.DataFrame(columns)[survey_columns]
+
+
+def write_survey_csv(output_path, row_count, seed=0, chunk_rows=1_000_000):
+    for chunk_start in range(0, row_count, chunk_rows):
+        chunk_size = min(chunk_rows, row_count - chunk_start)
+        chunk = generate_survey_data(chunk_size, seed + chunk_start, first_id=chunk_start + 1)
+        chunk.to_csv(output_path, index=False, mode='w' if chunk_start == 0 else 'a', header=chunk_start == 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic survey CSV with the training data schema.")
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_survey_csv(args.output, args.rows, args.seed)
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from query import build_query_index
+from spatial import build_map_clusters
+
+classification_column = 'Mobile money classification'
+count_dimensions = ['Age', 'Gender', 'Marital status', 'Ownership of land/plot']
+map_columns = ['Latitude', 'Longitude', classification_column]
+filter_dimensions = ['Gender', 'Highest level of education completed?', 'Ownership of land/plot']
+
+
+def build_aggregates(cleaned_data, income_columns, grid_resolutions=()):
+    counts = {}
+    for dimension in count_dimensions:
+        grouped_data = cleaned_data.groupby([dimension, classification_column], observed=True).size().reset_index(name='User Count')
+        for classification, group in grouped_data.groupby(classification_column, observed=True):
+            counts[(dimension, classification)] = group.reset_index(drop=True)
+
+    income_data = (cleaned_data[income_columns] == 'Yes').astype(int)
+    income_totals = income_data.groupby(cleaned_data[classification_column], observed=True).sum()
+
+    map_points = {}
+    for income_column in income_columns:
+        map_points[income_column] = cleaned_data.loc[income_data[income_column] == 1, map_columns].reset_index(drop=True)
+
+    return {
+        'counts': counts,
+        'income_totals': income_totals.transpose().reset_index(),
+        'map_points': map_points,
+        'map_clusters': build_map_clusters(cleaned_data, income_columns, grid_resolutions),
+        'query_index': build_query_index(cleaned_data, filter_dimensions + [classification_column], income_columns),
+    }
+
+
+def lookup_counts(aggregates, dimension, classification):
+    counts = aggregates['counts'].get((dimension, classification))
+    if counts is None:
+        return pd.DataFrame(columns=[dimension, classification_column, 'User Count'])
+    return counts
@@ -1,31 +1,402 @@
-import pandas as pd
-import plotly.express as px
-from dash import Dash, Input, Output, dcc, html
+import time
 
-from processing import load_and_clean_data, save_cleaned_data
+process_started_at = time.perf_counter()
 
-pd.set_option('future.no_silent_downcasting', True)
+import gc
+import importlib.util
+import itertools
+import os
+import threading
+from functools import lru_cache, partial
 
-input_file = "data/training.csv"
-cleaned_data = load_and_clean_data(input_file)
+from dash import Dash, Input, Output, State, callback_context, dcc, html
+from dash.exceptions import PreventUpdate
+from flask import abort, g, jsonify, request
 
-output_file = "data/cleaned_training.csv"
-save_cleaned_data(cleaned_data, output_file)
+import instrumentation
+from datasets import LoadedDatasets, data_size, read_datasets
+from inflight import SingleFlight, make_background_manager
+from instrumentation import stage
+from schema import financial_services, income_columns
+from spatial import read_grid_resolutions
 
-financial_services = [
-    'Does not use any financial service',
-    'Does not use mobile money',
-    'Uses mobile money only',
-    'Uses both'
-]
-income_columns = ['Salaries/wages', 'Trading/selling produce', 'Service providing income', 'Piece work/Casual labor',
-                  'Rental income', 'Interest from savings/investments', 'Pension', 'Social welfare grant', 
-                  'Expenses covered by others', 'Other income']
+cache_dir = "data/cache"
+datasets_file = os.environ.get("DATASETS")
+dataset_memory_budget = float(os.environ.get("DATASET_MEMORY_BUDGET_MB", "2048")) * 2**20
+cross_filter_cache_size = 64
+map_clustering = os.environ.get("MAP_CLUSTERING", "1") == "1"
+# "zoom:cell size" pairs, e.g. "0:0.5,6:0.25,7:0.1,9:0.02"; unset uses spatial.default_grid_resolutions.
+map_grid_resolutions = os.environ.get("MAP_GRID_RESOLUTIONS")
+data_reload_interval = float(os.environ.get("DATA_RELOAD_INTERVAL", "30"))
+background_callbacks = os.environ.get("BACKGROUND_CALLBACKS", "1") == "1"
+background_cache_dir = "data/cache/callbacks"
+background_result_expiry = 3600
+compact_payloads = os.environ.get("COMPACT_PAYLOADS", "1") == "1"
+static_snapshot_dir = os.environ.get("STATIC_SNAPSHOT")
+quality_report_page = os.environ.get("QUALITY_REPORT_PAGE") == "1"
+sample_size = int(os.environ.get("SAMPLE_SIZE", "0"))
+# A static snapshot only holds the exact figures.
+sampled_statistics = sample_size > 0 and not static_snapshot_dir
 
 financial_service_options = [{'label': financial_service, 'value': financial_service} for financial_service in financial_services]
-land_ownership_options = [{'label': land_owned, 'value': land_owned} for land_owned in cleaned_data['Ownership of land/plot'].unique()]
 income_column_options = [{'label': column, 'value': column} for column in income_columns]
 
+startup_timings = {}
+
+
+# pandas, Plotly Express and the cleaning pipeline are imported when the
+# data is first needed, so importing this module (in the debug reloader or
+# a gunicorn master without --preload) stays cheap.
+def load_dashboard_data(dataset, previous=None):
+    started_at = time.perf_counter()
+
+    import pandas as pd
+
+    from aggregates import build_aggregates
+    from cache import load_cleaned_data_cached, quality_report_path
+    from processing import save_cleaned_data
+    from quality import read_quality_report
+    from spatial import read_grid_resolutions
+
+    pd.set_option('future.no_silent_downcasting', True)
+
+    with stage("load_cleaned_data_cached") as timing:
+        # Rows appended to the survey since the previous load are cleaned on
+        # their own and appended to its frame.
+        cleaned_data = load_cleaned_data_cached(dataset['path'], dataset['cache_dir'], categorical=True,
+                                                loaded_data=previous['cleaned_data'] if previous else None)
+        timing.rows = len(cleaned_data)
+    if os.environ.get("EXPORT_CLEANED_CSV") == "1":
+        directory, file_name = os.path.split(dataset['path'])
+        save_cleaned_data(cleaned_data, os.path.join(directory, f"cleaned_{file_name}"))
+
+    grid_resolutions = read_grid_resolutions(map_grid_resolutions) if map_clustering else ()
+    with stage("build_aggregates", rows=len(cleaned_data)):
+        aggregates = {'exact': build_aggregates(cleaned_data, income_columns, grid_resolutions)}
+    if sampled_statistics:
+        from sampling import build_sample_aggregates
+
+        with stage("build_sample_aggregates", rows=len(cleaned_data)):
+            aggregates['sample'] = build_sample_aggregates(cleaned_data, sample_size, income_columns, grid_resolutions)
+
+    startup_timings['data_load_seconds'] = time.perf_counter() - started_at
+    print(f"Dashboard data for {dataset['path']} loaded in {startup_timings['data_load_seconds']:.2f}s")
+    # Written by the cleaning pass next to the cached data.
+    quality_report = read_quality_report(quality_report_path(dataset['path'], dataset['cache_dir'], True))
+    return {'cleaned_data': cleaned_data, 'aggregates': aggregates, 'quality_report': quality_report}
+
+
+# The cleaned cache is rebuilt from the survey file, by the load itself, so
+# only the survey file is watched.
+def data_signature(dataset):
+    try:
+        path_stat = os.stat(dataset['path'])
+    except OSError:
+        return None
+    return (path_stat.st_size, path_stat.st_mtime_ns)
+
+
+# In static mode the figures come from an exported snapshot: no pandas work
+# at all, only reading the snapshot's JSON files.
+def load_snapshot(previous=None):
+    from snapshot import read_manifest
+
+    manifest = read_manifest(static_snapshot_dir)
+    print(f"Serving the static snapshot in {static_snapshot_dir}")
+    return {'manifest': manifest}
+
+
+def snapshot_signature():
+    from snapshot import manifest_name
+
+    try:
+        path_stat = os.stat(os.path.join(static_snapshot_dir, manifest_name))
+    except OSError:
+        return None
+    return (path_stat.st_size, path_stat.st_mtime_ns)
+
+
+class DataStore:
+    def __init__(self, loader, signature, reload_interval):
+        self.loader = loader
+        self.signature = signature
+        self.reload_interval = reload_interval
+        self.data = None
+        self.size = 0
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.watching = True
+        # Threads do not survive a fork, so each gunicorn worker starts its own.
+        os.register_at_fork(after_in_child=self.restart_watching)
+
+    def get(self):
+        data = self.data
+        if data is None:
+            with self.lock:
+                if self.data is None:
+                    # Taken before loading, so a change made during the load
+                    # is seen by the next check.
+                    signature = self.signature()
+                    self.swap(self.loader(), signature)
+                    self.start_watching()
+                data = self.data
+        return data
+
+    def swap(self, data, signature):
+        # Versions are unique across datasets, so a version alone tells
+        # cached figures of different datasets and loads apart.
+        data['version'] = next(data_versions)
+        data['signature'] = signature
+        self.size = data_size(data)
+        # A single reference assignment: requests see the old data or the
+        # new data, never a mix, and never wait for a reload.
+        self.data = data
+        clear_figure_caches()
+
+    def unload(self):
+        with self.lock:
+            self.data = None
+            self.size = 0
+
+    def start_watching(self):
+        if self.watching and self.reload_interval > 0 and self.watcher is None:
+            self.watcher = threading.Thread(target=self.watch, name="data-reload", daemon=True)
+            self.watcher.start()
+
+    def restart_watching(self):
+        self.watcher = None
+        self.watching = True
+        if self.data is not None:
+            self.start_watching()
+
+    def watch(self):
+        failed_signature = None
+        while True:
+            time.sleep(self.reload_interval)
+            # An unloaded dataset is not watched; loading it again restarts this.
+            with self.lock:
+                if self.data is None:
+                    self.watcher = None
+                    return
+                previous = self.data
+            signature = self.signature()
+            if signature in (previous['signature'], failed_signature):
+                continue
+            try:
+                data = self.loader(previous)
+            except Exception as error:
+                print(f"Reloading the dashboard data failed, keeping the current data: {error}")
+                failed_signature = signature
+            else:
+                # Unloaded while reloading: swapping in would load it again
+                # behind the memory budget's back.
+                with self.lock:
+                    if self.data is None:
+                        self.watcher = None
+                        return
+                    self.swap(data, signature)
+
+
+data_versions = itertools.count(1)
+
+# A static snapshot holds the views of one dataset, named after its directory.
+if static_snapshot_dir:
+    datasets = {os.path.basename(os.path.normpath(static_snapshot_dir)): {}}
+    data_stores = {name: DataStore(load_snapshot, snapshot_signature, data_reload_interval) for name in datasets}
+else:
+    datasets = read_datasets(datasets_file, cache_dir)
+    data_stores = {name: DataStore(partial(load_dashboard_data, dataset), partial(data_signature, dataset), data_reload_interval)
+                   for name, dataset in datasets.items()}
+default_dataset = next(iter(datasets))
+loaded_datasets = LoadedDatasets(data_stores, dataset_memory_budget)
+
+
+def get_data(dataset_name):
+    if dataset_name not in data_stores:
+        raise PreventUpdate
+    return loaded_datasets.get(dataset_name)
+
+
+def build_figure(dataset_name, data_version, statistics, graph_id, *arguments):
+    data = get_data(dataset_name)
+    if 'manifest' in data:
+        from snapshot import read_snapshot_figure
+
+        with stage(f"figure:{graph_id}:read_snapshot"):
+            figure = read_snapshot_figure(static_snapshot_dir, data['manifest'], graph_id, arguments)
+        # Views the snapshot does not hold keep the graph as it is.
+        if figure is None:
+            raise PreventUpdate
+    else:
+        from figures import figure_builders, mark_estimate
+
+        aggregates = data['aggregates'].get(statistics, data['aggregates']['exact'])
+        with stage(f"figure:{graph_id}:build"):
+            figure = mark_estimate(figure_builders[graph_id](aggregates, *arguments), aggregates)
+        with stage(f"figure:{graph_id}:to_dict"):
+            figure = figure.to_dict()
+    if compact_payloads:
+        from payload import compact_figure
+
+        with stage(f"figure:{graph_id}:compact"):
+            figure = compact_figure(figure)
+    return figure
+
+
+figure_flights = SingleFlight()
+
+
+# The figure cache does not stop concurrent requests for a figure it does
+# not hold yet from each building it, so they share one build.
+def cached_figure(dataset_name, statistics, graph_id, *arguments):
+    data_version = get_data(dataset_name)['version']
+    return figure_flights.do((data_version, statistics, graph_id, arguments),
+                             figure_caches[graph_id], dataset_name, data_version, statistics, graph_id, *arguments)
+
+
+# Graph id -> layout the page shows until the graph's first update.
+placeholder_layouts = {}
+
+
+def first_view_arguments(graph_id):
+    if graph_id in graph_dropdowns:
+        return (financial_services[0],)
+    if graph_id == 'cross-filter-graph':
+        return (tuple((dimension, ()) for dimension in cross_filter_dropdowns.values()),)
+    if not map_clustering:
+        return (income_columns[0],)
+    view = map_view(None)
+    if static_snapshot_dir:
+        return (income_columns[0], view['cell_size'])
+    return (income_columns[0], view['cell_size'], tuple(view['bounds']))
+
+
+def specimen_aggregates():
+    # A survey of one respondent per mobile money classification: enough to
+    # build every graph, and so its layout, without loading any data.
+    import pandas as pd
+
+    from aggregates import build_aggregates
+    from processing import relabel_columns
+    from schema import survey_schema
+    from spatial import default_map_center
+
+    classifications = list(survey_schema['mobile_money_classification']['allowed'])
+    specimen = pd.DataFrame({column: [spec['allowed'][-1] if 'allowed' in spec else 1] * len(classifications)
+                             for column, spec in survey_schema.items()})
+    specimen['mobile_money_classification'] = classifications
+    specimen['Latitude'] = default_map_center['lat']
+    specimen['Longitude'] = default_map_center['lon']
+    grid_resolutions = read_grid_resolutions(map_grid_resolutions) if map_clustering else ()
+    return build_aggregates(relabel_columns(specimen, categorical=True), income_columns, grid_resolutions)
+
+
+# Graph id -> (static layout, trace types) of the graph: the layout every
+# view of it shares, which the page holds so updates need not send it.
+@lru_cache(maxsize=None)
+def static_layouts():
+    from payload import static_layout
+
+    if static_snapshot_dir:
+        figures = {}
+        for graph_id in figure_caches:
+            try:
+                figures[graph_id] = cached_figure(default_dataset, 'exact', graph_id, *first_view_arguments(graph_id))
+            except PreventUpdate:
+                pass
+    else:
+        from figures import figure_builders
+        from payload import compact_figure
+
+        aggregates = specimen_aggregates()
+        figures = {graph_id: compact_figure(figure_builders[graph_id](aggregates, *first_view_arguments(graph_id)).to_dict())
+                   for graph_id in figure_caches}
+    return {graph_id: (static_layout(figure['layout']), sorted({trace['type'] for trace in figure['data']}))
+            for graph_id, figure in figures.items()}
+
+
+def initial_figure(graph_id):
+    placeholder_layout = placeholder_layouts.get(graph_id, {})
+    if not compact_payloads:
+        return {'data': [], 'layout': placeholder_layout}
+
+    from payload import static_figure
+
+    layout, trace_types = static_layouts().get(graph_id, ({}, None))
+    return static_figure({**layout, **placeholder_layout}, trace_types)
+
+
+# In compact mode the page already holds each graph's static layout, so an
+# update only patches in the traces and the title text.
+def figure_response(graph_id, figure):
+    if not compact_payloads:
+        return figure
+
+    from payload import figure_patch
+
+    layout, _ = static_layouts().get(graph_id, (None, None))
+    return figure_patch(figure, layout, placeholder_layouts.get(graph_id))
+
+
+def background_cache_key():
+    # Runs in the request before a background job is forked: loading the
+    # data here lets every job inherit it instead of loading its own copy.
+    dataset_name = callback_context.inputs.get('dataset-dropdown.value')
+    if dataset_name not in data_stores:
+        return None
+    # The signature of the data the job inherits, not of the files as they
+    # are now: a job forked with old data stores its map under the old key.
+    return get_data(dataset_name)['signature']
+
+
+map_placeholder_figure = {
+    'data': [],
+    'layout': {
+        'xaxis': {'visible': False},
+        'yaxis': {'visible': False},
+        'annotations': [{'text': "Loading the map...", 'showarrow': False, 'font': {'size': 20}}],
+    },
+}
+
+placeholder_layouts['income-choropleth-map'] = map_placeholder_figure['layout']
+
+graph_dropdowns = {
+    'financial-service-age-graph': 'financial-service-dropdown',
+    'pie-chart-by-gender': 'financial-service-gender-dropdown',
+    'pie-chart-by-marital': 'financial-service-marital-dropdown',
+    'land-owned-bar-graph': 'finanical-service-for-land-ownership',
+    'income-category-bar-graph': 'financial-service-income-bar-dropdown',
+}
+
+# Dropdown id -> the dimension it filters the cross-filter graph on.
+cross_filter_dropdowns = {
+    'cross-filter-gender-dropdown': 'Gender',
+    'cross-filter-education-dropdown': 'Highest level of education completed?',
+    'cross-filter-land-dropdown': 'Ownership of land/plot',
+    'cross-filter-income-dropdown': 'Income source',
+}
+
+# Repeat selections skip building the figure; the data version in the key
+# keeps figures of replaced data from being served. The category graphs'
+# cache holds every view of the dataset their dropdowns can select, and the
+# map's every income column at every grid level, pans adding views that
+# push out the least recently used. The cross-filter graph has too many
+# combinations of selections to hold, so it gets a bounded cache of its own
+# that cannot push out the other graphs' views.
+statistics_modes = 2 if sampled_statistics else 1
+map_levels = len(read_grid_resolutions(map_grid_resolutions)) if map_clustering else 1
+category_figures = lru_cache(maxsize=len(graph_dropdowns) * len(financial_services) * statistics_modes)(build_figure)
+map_figures = lru_cache(maxsize=len(income_columns) * map_levels * statistics_modes)(build_figure)
+cross_filter_figures = lru_cache(maxsize=cross_filter_cache_size)(build_figure)
+figure_caches = {graph_id: category_figures for graph_id in graph_dropdowns}
+figure_caches['income-choropleth-map'] = map_figures
+figure_caches['cross-filter-graph'] = cross_filter_figures
+
+
+def clear_figure_caches():
+    for figure_cache in (category_figures, map_figures, cross_filter_figures):
+        figure_cache.cache_clear()
+
 
 external_stylesheets = [
     {
@@ -37,180 +408,331 @@ external_stylesheets = [
     },
 ]
 
-app = Dash(__name__, external_stylesheets=external_stylesheets)
-app.title = "Financial Services used in Tanzania"
-
-app.layout = html.Div([
-    html.Div([
-        html.H1("Financial Services Uses in Tanzania", className="header-title"),
-        html.P("A look at the different finanical services used across the country of Tanzania", className="header-description")
-    ], className="Header"),
-
-    html.Div([
-        html.Label("Select Financial Service Category:", className="dropdown-label"),
-        dcc.Dropdown(
-            id='financial-service-dropdown',
-            options=financial_service_options,
-            value=financial_services[0],
-            clearable=False,
-            className="dropdown"
-        ),
-        dcc.Graph(id='financial-service-age-graph', className="graph"),
+
+# The grid cell size and the bounds of the clusters sent for the map view.
+def map_view(relayout_data):
+    if not map_clustering:
+        return None
+
+    from spatial import cell_size_for_zoom, default_map_center, default_map_zoom, read_grid_resolutions, view_bounds
+
+    zoom = (relayout_data or {}).get('mapbox.zoom', default_map_zoom)
+    center = (relayout_data or {}).get('mapbox.center', default_map_center)
+    return {'cell_size': cell_size_for_zoom(zoom, read_grid_resolutions(map_grid_resolutions)),
+            'bounds': list(view_bounds(center, zoom))}
+
+
+def cross_filter_options(dimension):
+    if dimension == 'Income source':
+        return income_column_options
+
+    from schema import survey_schema
+
+    labels = next(spec['labels'] for spec in survey_schema.values() if spec['name'] == dimension)
+    return [{'label': label, 'value': label} for label in labels.values()]
+
+
+statistics_options = [
+    {'label': "Estimated from a stratified sample", 'value': 'sample'},
+    {'label': "Exact counts", 'value': 'exact'},
+]
+
+
+def serve_layout():
+    return html.Div([
+        html.Div([
+            html.H1("Financial Services Uses in Tanzania", className="header-title"),
+            html.P("A look at the different finanical services used across the country of Tanzania", className="header-description")
+        ], className="Header"),
 
         html.Div([
+            html.Label("Select Survey:", className="dropdown-label"),
+            dcc.Dropdown(
+                id='dataset-dropdown',
+                options=[{'label': name, 'value': name} for name in datasets],
+                value=default_dataset,
+                clearable=False,
+                className="dropdown"
+            ),
+
             html.Div([
-                html.Label("Select Financial Service Category for Gender Distribution:", className="dropdown-label"),
-                dcc.Dropdown(
-                    id='financial-service-gender-dropdown',
-                    options=financial_service_options,
-                    value=financial_services[0],
-                    clearable=False,
-                    className="dropdown"
+                html.Label("Statistics:", className="dropdown-label"),
+                dcc.RadioItems(
+                    id='statistics-toggle',
+                    options=statistics_options,
+                    value='sample' if sampled_statistics else 'exact',
+                    inline=True
                 ),
-                dcc.Graph(id="pie-chart-by-gender", className="graph")
-            ], className="graph-container"),
-            
+            ], style=None if sampled_statistics else {'display': 'none'}),
+
+            html.Label("Select Financial Service Category:", className="dropdown-label"),
+            dcc.Dropdown(
+                id='financial-service-dropdown',
+                options=financial_service_options,
+                value=financial_services[0],
+                clearable=False,
+                className="dropdown"
+            ),
+            dcc.Graph(id='financial-service-age-graph', figure=initial_figure('financial-service-age-graph'), className="graph"),
+
             html.Div([
-                html.Label("Select Financial Service Category for Marital Status Distribution:", className="dropdown-label"),
-                dcc.Dropdown(
-                    id='financial-service-marital-dropdown',
-                    options=financial_service_options,
-                    value=financial_services[0],
-                    clearable=False,
-                    className="dropdown"
-                ),
-                dcc.Graph(id="pie-chart-by-marital", className="graph")
-            ], className="graph-container"),
-        ]),
-
-        html.Label("Select Financial Service Category for the Type of land ownership Distribution:", className="dropdown-label"),
-        dcc.Dropdown(
-            id='finanical-service-for-land-ownership',
-            options=financial_service_options,
-            value=financial_services[0],
-            clearable=False,
-            className="dropdown"
-        ),
-        dcc.Graph(id="land-owned-bar-graph", className="graph"),
-
-        html.Label("Select Financial Service Category for Income Distribution:", className="dropdown-label"),
-        dcc.Dropdown(
-            id='financial-service-income-bar-dropdown',
-            options=financial_service_options,
-            value=financial_services[0],
-            clearable=False,
-            className="dropdown"
-        ),
-        dcc.Graph(id="income-category-bar-graph", className="graph"),
-
-        html.Label("Select Income Category for Map Distribution:", className="dropdown-label"),
-        dcc.Dropdown(
-            id='income-column-dropdown',
-            options=income_column_options,
-            value=income_columns[0],
-            clearable=False,
-            className="dropdown"
-        ),
-        dcc.Graph(id="income-choropleth-map", className="graph")
-    ], className="content")
-])
-
-
-
-@app.callback(
-    [Output('financial-service-age-graph', 'figure'),
-     Output('pie-chart-by-gender', 'figure'),
-     Output('pie-chart-by-marital', 'figure'),
-     Output('land-owned-bar-graph', 'figure'),
-     Output('income-category-bar-graph', 'figure'),
-     Output('income-choropleth-map', 'figure')],
-    [Input('financial-service-dropdown', 'value'),
-     Input('financial-service-gender-dropdown', 'value'),
-     Input('financial-service-marital-dropdown', 'value'),
-     Input('finanical-service-for-land-ownership', 'value'),
-     Input('financial-service-income-bar-dropdown', 'value'),
-     Input('income-column-dropdown', 'value')]
-)
-
-
-def update_graphs(selected_category, gender_category, marital_category, land_ownership_category, income_category, selected_income_column):
-    
-    
-    filtered_data = cleaned_data[cleaned_data['Mobile money classification'] == selected_category]
-    grouped_data = filtered_data.groupby(['Age', 'Mobile money classification']).size().reset_index(name='User Count')
-    age_chart = px.scatter(grouped_data, x='Age', y='User Count', color='Mobile money classification',
-                           title=f"Number of Users per Age Group for the <br>Mobile Money Classification: '{selected_category}'",
-                           labels={'Age': 'Age of users', 'User Count': 'Number of Users', 'Mobile money classification': 'Mobile Money Classification'})
-    age_chart.update_layout(legend_title_text='Mobile Money Classification',
-                            title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
-                            xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                            yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                            legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
-    age_chart.update_traces(hovertemplate='Age: %{x}<br>Number of Users: %{y}')
-
-    gender_data = cleaned_data[cleaned_data['Mobile money classification'] == gender_category]
-    gender_pie_chart = px.pie(gender_data, names='Gender', 
-                              title=f"Gender Distribution for the Mobile Money Classification: '{gender_category}'")
-    gender_pie_chart.update_layout(legend_title_text='Gender',
-                                   title={'font': {'size': 20, 'family': 'Arial', 'weight': 'bold'}},
-                                   legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
-    gender_pie_chart.update_traces(hovertemplate='Gender: %{label}<extra></extra>')
-    
-    marital_data = cleaned_data[cleaned_data['Mobile money classification'] == marital_category]
-    marital_pie_chart = px.pie(marital_data, names='Marital status', 
-                               title=f"Marital Status Distribution for the Mobile Money Classification: '{marital_category}'")
-    marital_pie_chart.update_layout(legend_title_text='Marital Status',
-                                    title={'font': {'size': 20, 'family': 'Arial', 'weight': 'bold'}},
-                                    legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
-    marital_pie_chart.update_traces(hovertemplate='Marital Status: %{label}<extra></extra>')
-
-    
-    land_data = cleaned_data[cleaned_data['Mobile money classification'] == land_ownership_category]
-    grouped_land_data = land_data.groupby(['Ownership of land/plot', 'Mobile money classification']).size().reset_index(name='User Count')
-    land_ownership_bar = px.bar(grouped_land_data, x='Ownership of land/plot', y='User Count', color='Mobile money classification',
-                                title=f"Land Ownership Distribution for the <br>Mobile Money Classification: '{land_ownership_category}' ",
-                                labels={'Ownership of land/plot': 'Land Ownership', 'User Count': 'Number of Users', 'Mobile money classification': 'Mobile Money Classification'})
-    land_ownership_bar.update_layout(title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
-                                    xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                                    yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                                    legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
-    land_ownership_bar.update_traces(hovertemplate='Land status: %{label}<extra></extra>')
-
- 
-    filtered_income_data = cleaned_data[income_columns + ['Mobile money classification']].copy()
-    filtered_income_data.replace({'Yes': 1, 'No': 0}, inplace=True)
-    grouped_income_data = filtered_income_data.groupby(['Mobile money classification']).sum()
-    grouped_income_data_transposed = grouped_income_data.transpose().reset_index()
-    income_category_bar = px.bar(grouped_income_data_transposed, x='index', y=income_category, 
-                                 title=f"Income Category Distribution for the <br>Mobile Money Classification:'{income_category}'",
-                                 labels={'index': 'Income Category', income_category: 'Number of Users'})
-    income_category_bar.update_layout(legend_title_text='Mobile Money Classification',
-                                      title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
-                                      xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                                      yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
-                                      legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
-    income_category_bar.update_traces(hovertemplate='Income catergory: %{x}<br>Number of users: %{y}')
-
-    income_filtered_data = cleaned_data[cleaned_data[selected_income_column] == 'Yes']
-    income_map_distribution = px.scatter_mapbox(
-        income_filtered_data, 
-        lat='Latitude', 
-        lon='Longitude',
-        color='Mobile money classification',  
-        hover_data={'Latitude': True, 'Longitude': True}, 
-        mapbox_style="carto-positron", 
-        zoom=5,  
-        center={"lat": -6.369028, "lon": 34.888822},  
-        title=f"Income Distribution for {selected_income_column}"
-    ) 
-    income_map_distribution.update_traces(hovertemplate='Mobile Money Classification: %{text}<extra></extra>',
-                                          text=income_filtered_data['Mobile money classification'],
-                                          marker=dict(size=8.5, opacity=0.7))     
-    income_map_distribution.update_layout(legend_title_text='Mobile Money Classification',
-                                          margin={"r":0,"t":0,"l":0,"b":0},
-                                          legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})   
-
-    return age_chart, gender_pie_chart, marital_pie_chart, land_ownership_bar, income_category_bar, income_map_distribution
+                html.Div([
+                    html.Label("Select Financial Service Category for Gender Distribution:", className="dropdown-label"),
+                    dcc.Dropdown(
+                        id='financial-service-gender-dropdown',
+                        options=financial_service_options,
+                        value=financial_services[0],
+                        clearable=False,
+                        className="dropdown"
+                    ),
+                    dcc.Graph(id="pie-chart-by-gender", figure=initial_figure("pie-chart-by-gender"), className="graph")
+                ], className="graph-container"),
+            
+                html.Div([
+                    html.Label("Select Financial Service Category for Marital Status Distribution:", className="dropdown-label"),
+                    dcc.Dropdown(
+                        id='financial-service-marital-dropdown',
+                        options=financial_service_options,
+                        value=financial_services[0],
+                        clearable=False,
+                        className="dropdown"
+                    ),
+                    dcc.Graph(id="pie-chart-by-marital", figure=initial_figure("pie-chart-by-marital"), className="graph")
+                ], className="graph-container"),
+            ]),
+
+            html.Label("Select Financial Service Category for the Type of land ownership Distribution:", className="dropdown-label"),
+            dcc.Dropdown(
+                id='finanical-service-for-land-ownership',
+                options=financial_service_options,
+                value=financial_services[0],
+                clearable=False,
+                className="dropdown"
+            ),
+            dcc.Graph(id="land-owned-bar-graph", figure=initial_figure("land-owned-bar-graph"), className="graph"),
+
+            html.Label("Select Financial Service Category for Income Distribution:", className="dropdown-label"),
+            dcc.Dropdown(
+                id='financial-service-income-bar-dropdown',
+                options=financial_service_options,
+                value=financial_services[0],
+                clearable=False,
+                className="dropdown"
+            ),
+            dcc.Graph(id="income-category-bar-graph", figure=initial_figure("income-category-bar-graph"), className="graph"),
+
+            html.Label("Select Income Category for Map Distribution:", className="dropdown-label"),
+            dcc.Dropdown(
+                id='income-column-dropdown',
+                options=income_column_options,
+                value=income_columns[0],
+                clearable=False,
+                className="dropdown"
+            ),
+            html.P(id="income-map-status", className="graph-status"),
+            dcc.Store(id="income-map-view", data=map_view(None)),
+            dcc.Graph(id="income-choropleth-map", figure=initial_figure("income-choropleth-map"), className="graph"),
+
+            html.Label("Filter Users by Gender, Education, Land Ownership and Income Source:", className="dropdown-label"),
+            # A static snapshot only holds the unfiltered view.
+            html.P("Filtering is not available in the static snapshot.", className="graph-status")
+            if static_snapshot_dir else None,
+            html.Div([dcc.Dropdown(
+                id=dropdown_id,
+                options=cross_filter_options(dimension),
+                multi=True,
+                placeholder=f"All ({dimension})",
+                className="dropdown"
+            ) for dropdown_id, dimension in cross_filter_dropdowns.items()], style={'display': 'none'} if static_snapshot_dir else None),
+            dcc.Graph(id="cross-filter-graph", figure=initial_figure("cross-filter-graph"), className="graph")
+        ], className="content")
+    ])
+
+
+def register_callbacks(app, background_manager=None):
+    def register_figure_callback(graph_id, dropdown_id):
+        @app.callback(Output(graph_id, 'figure'),
+                      Input('dataset-dropdown', 'value'), Input('statistics-toggle', 'value'), Input(dropdown_id, 'value'))
+        def update_graph(dataset_name, statistics, category):
+            with stage(f"callback:{graph_id}"):
+                return figure_response(graph_id, cached_figure(dataset_name, statistics, graph_id, category))
+
+    for graph_id, dropdown_id in graph_dropdowns.items():
+        register_figure_callback(graph_id, dropdown_id)
+
+    # The map is the most expensive figure, so when a background manager is
+    # available it is built in a job process and the request thread is freed.
+    map_callback_options = {}
+    if background_manager is not None:
+        map_callback_options = {
+            'background': True,
+            'manager': background_manager,
+            'interval': 250,
+            'running': [(Output('income-map-status', 'children'), "Building the map...", "")],
+        }
+
+    # The view is turned into a grid cell size and snapped bounds in the
+    # request, so the map callback, and the background job's cache key, only
+    # see those and not every pan and zoom of the view.
+    # Small pans, and zooms within a grid level, leave them, and so the map,
+    # as they are.
+    @app.callback(Output('income-map-view', 'data'), Input('income-choropleth-map', 'relayoutData'),
+                  State('income-map-view', 'data'), prevent_initial_call=True)
+    def update_map_view(relayout_data, current_view):
+        if not map_clustering or not {'mapbox.zoom', 'mapbox.center'} <= set(relayout_data or {}):
+            raise PreventUpdate
+        view = map_view(relayout_data)
+        if view == current_view:
+            raise PreventUpdate
+        return view
+
+    @app.callback(Output('income-choropleth-map', 'figure'),
+                  Input('dataset-dropdown', 'value'),
+                  Input('statistics-toggle', 'value'),
+                  Input('income-column-dropdown', 'value'),
+                  Input('income-map-view', 'data'),
+                  **map_callback_options)
+    def update_income_map(dataset_name, statistics, selected_income_column, view):
+        with stage("callback:income-choropleth-map"):
+            if not map_clustering:
+                figure = cached_figure(dataset_name, statistics, 'income-choropleth-map', selected_income_column)
+                return figure_response('income-choropleth-map', figure)
+
+            # A snapshot holds each grid level's whole map.
+            if static_snapshot_dir:
+                figure = cached_figure(dataset_name, statistics, 'income-choropleth-map', selected_income_column, view['cell_size'])
+            else:
+                figure = cached_figure(dataset_name, statistics, 'income-choropleth-map', selected_income_column,
+                                       view['cell_size'], tuple(view['bounds']))
+            return figure_response('income-choropleth-map', figure)
+
+    @app.callback(Output('cross-filter-graph', 'figure'),
+                  [Input('dataset-dropdown', 'value'), Input('statistics-toggle', 'value')]
+                  + [Input(dropdown_id, 'value') for dropdown_id in cross_filter_dropdowns])
+    def update_cross_filter(dataset_name, statistics, *selected_values):
+        # Sorted tuples, so the same selection in any order hits the figure cache.
+        filters = tuple((dimension, tuple(sorted(values or ())))
+                        for dimension, values in zip(cross_filter_dropdowns.values(), selected_values))
+        with stage("callback:cross-filter-graph"):
+            return figure_response('cross-filter-graph', cached_figure(dataset_name, statistics, 'cross-filter-graph', filters))
+
+
+def report_time_to_first_request(server):
+    reported = threading.Event()
+
+    @server.after_request
+    def report(response):
+        if not reported.is_set():
+            reported.set()
+            startup_timings['time_to_first_request_seconds'] = time.perf_counter() - process_started_at
+            print(f"Time to first request: {startup_timings['time_to_first_request_seconds']:.2f}s")
+        return response
+
+
+# Requests to the callback endpoint cover the Dash JSON serialization of the
+# returned figures, which the callbacks themselves cannot time.
+def instrument_requests(server):
+    @server.before_request
+    def start_timing():
+        g.request_started_at = time.perf_counter()
+
+    @server.after_request
+    def record_timing(response):
+        started_at = g.pop('request_started_at', None)
+        if started_at is not None and request.path.startswith('/_dash-update-component'):
+            instrumentation.record_stage(f"request:{request.path}", time.perf_counter() - started_at,
+                                         size_bytes=response.calculate_content_length())
+        return response
+
+
+def register_metrics_endpoint(server):
+    @server.route('/metrics')
+    def metrics():
+        return jsonify({**instrumentation.metrics_snapshot(), 'startup': startup_timings})
+
+
+# A static snapshot has no cleaning pass behind it, so there is no report to show.
+def register_quality_report_page(server):
+    def current_report():
+        dataset_name = request.args.get('dataset', default_dataset)
+        if dataset_name not in data_stores:
+            abort(404)
+        report = loaded_datasets.get(dataset_name).get('quality_report')
+        if report is None:
+            abort(404)
+        return report
+
+    @server.route('/quality')
+    def quality_page():
+        from quality import quality_report_html
+        from schema import survey_schema
+
+        return quality_report_html(current_report(), survey_schema)
+
+    @server.route('/quality.json')
+    def quality_json():
+        return jsonify(current_report())
+
+
+def create_app(preload=False):
+    if preload:
+        # The gunicorn master only forks the workers and serves no requests,
+        # so only the workers watch the files. When they reload together,
+        # the cache lock lets one of them clean while the others wait for it.
+        for store in data_stores.values():
+            store.watching = False
+        loaded_datasets.get(default_dataset)
+        # Keep the loaded frame out of later collections so forked workers
+        # do not touch, and so copy, its pages.
+        gc.freeze()
+
+    # Responses are gzip-compressed when flask-compress is installed.
+    compress = importlib.util.find_spec("flask_compress") is not None
+    app = Dash(__name__, external_stylesheets=external_stylesheets, compress=compress)
+    app.title = "Financial Services used in Tanzania"
+    app.layout = serve_layout
+    background_manager = None
+    # Snapshot figures are only read from disk, so they need no background job.
+    if background_callbacks and not static_snapshot_dir:
+        background_manager = make_background_manager(background_cache_dir, background_cache_key, background_result_expiry)
+    register_callbacks(app, background_manager)
+    report_time_to_first_request(app.server)
+    register_metrics_endpoint(app.server)
+    if quality_report_page:
+        register_quality_report_page(app.server)
+    if instrumentation.enabled:
+        instrument_requests(app.server)
+    return app
+
+
+# Run with gunicorn --preload so the master loads the data once and the
+# workers share it copy-on-write:
+#   DASHBOARD_PRELOAD=1 gunicorn --pythonpath source --preload app:server
+app = create_app(preload=os.environ.get("DASHBOARD_PRELOAD") == "1")
+server = app.server
+
+
+def export_dashboard_snapshot(output_dir, dataset_name, workers=None):
+    from snapshot import export_snapshot, snapshot_views
+    from spatial import read_grid_resolutions
+
+    default_filters = tuple((dimension, ()) for dimension in cross_filter_dropdowns.values())
+    grid_resolutions = read_grid_resolutions(map_grid_resolutions)
+    views = snapshot_views(list(graph_dropdowns), financial_services, income_columns, grid_resolutions, default_filters)
+    dataset = datasets[dataset_name]
+    export_snapshot(output_dir, views, dataset['path'], dataset['cache_dir'], income_columns, grid_resolutions, workers)
+
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the dashboard, or export every view of it as static files.")
+    parser.add_argument('--export-snapshot', metavar='DIR', help="Render every figure into DIR and exit")
+    parser.add_argument('--dataset', choices=list(datasets), default=default_dataset, help="Dataset the snapshot is rendered from")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processes rendering the snapshot")
+    args = parser.parse_args()
+
+    if args.export_snapshot:
+        export_dashboard_snapshot(args.export_snapshot, args.dataset, args.workers)
+    else:
+        app.run_server(debug=True)
@@ -0,0 +1,97 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import repeat
+
+import pandas as pd
+
+from files import next_line_start, open_byte_range
+from processing import apply_validation_rules, relabel_columns
+from quality import merge_quality_reports, new_quality_report, write_quality_report
+from streaming import count_values, merge_value_counts, plan_cleaning, read_dtypes
+
+
+# A shard is (file, first byte, end byte, column names): whole files have
+# no byte range and read their own header.
+def file_shards(filepaths):
+    return [(filepath, 0, None, None) for filepath in filepaths]
+
+
+def byte_range_shards(filepath, shard_count):
+    # Equal byte ranges moved to line starts, so each shard parses only its
+    # own rows, without scanning the file first.
+    with open(filepath, 'rb') as source_file:
+        header = source_file.readline().decode().rstrip('\r\n')
+        data_start = source_file.tell()
+        file_size = os.fstat(source_file.fileno()).st_size
+        boundaries = [data_start + (file_size - data_start) * number // shard_count for number in range(shard_count)]
+        boundaries = sorted({next_line_start(source_file, boundary) for boundary in boundaries} | {file_size})
+    column_names = next(csv.reader([header]))
+    return [(filepath, start, end, column_names) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def read_shard(shard, dtype=None):
+    filepath, start, end, column_names = shard
+    if column_names is None:
+        return pd.read_csv(filepath, sep=",", dtype=dtype)
+    with open(filepath, 'rb') as source_file:
+        return pd.read_csv(open_byte_range(source_file, start, end), sep=",", header=None, names=column_names, dtype=dtype)
+
+
+def count_shard_values(shard):
+    return count_values(read_shard(shard))
+
+
+def validate_shard(shard, value_counts, mode_values, inconsistent_columns):
+    pd.set_option('future.no_silent_downcasting', True)
+    shard_data = read_shard(shard, read_dtypes(value_counts))
+    report = new_quality_report()
+    apply_validation_rules(shard_data, mode_values, inconsistent_columns, report)
+    return shard_data, report
+
+
+def clean_shards_parallel(shards, output_path=None, workers=None, categorical=False, report_path=None):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Modes must come from the whole dataset, so the shards' value counts
+        # are merged before any shard is cleaned.
+        value_counts = reduce(merge_value_counts, executor.map(count_shard_values, shards))
+        mode_values, inconsistent_columns = plan_cleaning(value_counts)
+
+        validated_shards, reports = zip(*executor.map(validate_shard, shards, repeat(value_counts),
+                                                      repeat(mode_values), repeat(inconsistent_columns)))
+        financial_service_df = pd.concat(validated_shards, ignore_index=True)
+
+    financial_service_df = relabel_columns(financial_service_df, categorical)
+
+    if output_path is not None:
+        financial_service_df.to_csv(output_path, index=False)
+        print(f"Cleaned data saved to {output_path}")
+    if report_path is not None:
+        write_quality_report(merge_quality_reports(reports), report_path)
+        print(f"Data-quality report saved to {report_path}")
+
+    return financial_service_df
+
+
+def clean_files_parallel(filepaths, output_path=None, workers=None, categorical=False, report_path=None):
+    return clean_shards_parallel(file_shards(filepaths), output_path, workers, categorical, report_path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clean survey CSV files, or byte ranges of one file, across processes.")
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shards', type=int, default=None,
+                        help="Split a single input file into this many ranges of whole lines")
+    parser.add_argument('--report', default=None, help="Also write a data-quality report to this JSON file")
+    args = parser.parse_args()
+
+    pd.set_option('future.no_silent_downcasting', True)
+    if args.shards is not None and len(args.inputs) == 1:
+        clean_shards_parallel(byte_range_shards(args.inputs[0], args.shards), args.output, args.workers, report_path=args.report)
+    else:
+        clean_files_parallel(args.inputs, args.output, args.workers, report_path=args.report)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from files import file_lock, open_byte_range, replacing
+from incremental import (append_to_frame, clean_appended_rows, cleaned_bytes_digest, cleaning_state, imputed_columns,
+                         read_state, write_state)
+from instrumentation import stage
+from processing import clean_survey_data, cleaning_rules_version
+from quality import merge_quality_reports, new_quality_report, read_quality_report, write_quality_report
+from schema import read_survey_csv
+from streaming import count_values, plan_cleaning
+
+
+def file_sha256(filepath, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_paths(filepath, cache_dir, categorical):
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    if categorical:
+        name += "-categorical"
+    return os.path.join(cache_dir, f"{name}.feather"), os.path.join(cache_dir, f"{name}.json")
+
+
+def quality_report_path(filepath, cache_dir, categorical):
+    return os.path.splitext(cache_paths(filepath, cache_dir, categorical)[0])[0] + ".quality.json"
+
+
+def incremental_state_path(filepath, cache_dir, categorical):
+    return os.path.splitext(cache_paths(filepath, cache_dir, categorical)[0])[0] + ".state"
+
+
+def read_cache_metadata(metadata_path):
+    try:
+        with open(metadata_path) as metadata_file:
+            return json.load(metadata_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache_metadata(metadata_path, metadata):
+    with replacing(metadata_path) as temporary_path:
+        with open(temporary_path, 'w') as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+
+
+def is_cache_valid(filepath, data_path, metadata_path, metadata):
+    if metadata is None or not os.path.exists(data_path):
+        return False
+    if metadata.get('rules_version') != cleaning_rules_version():
+        return False
+
+    source_stat = os.stat(filepath)
+    if metadata['source_size'] == source_stat.st_size and metadata['source_mtime_ns'] == source_stat.st_mtime_ns:
+        return True
+
+    # The file was touched or copied: only rebuild if its contents changed.
+    if metadata['source_size'] == source_stat.st_size and metadata['source_sha256'] == file_sha256(filepath):
+        metadata['source_mtime_ns'] = source_stat.st_mtime_ns
+        write_cache_metadata(metadata_path, metadata)
+        return True
+
+    return False
+
+
+def read_valid_cache(filepath, data_path, metadata_path, report_path):
+    metadata = read_cache_metadata(metadata_path)
+    if os.path.exists(report_path) and is_cache_valid(filepath, data_path, metadata_path, metadata):
+        return pd.read_feather(data_path)
+    return None
+
+
+def source_metadata(filepath, source_stat, categorical):
+    return {
+        'source': os.path.abspath(filepath),
+        'source_size': source_stat.st_size,
+        'source_mtime_ns': source_stat.st_mtime_ns,
+        'source_sha256': file_sha256(filepath),
+        'rules_version': cleaning_rules_version(),
+        'categorical': categorical,
+    }
+
+
+def ends_with_newline(source_file, size):
+    source_file.seek(max(0, size - 1))
+    return source_file.read(1) == b'\n'
+
+
+def rebuild_cache(filepath, categorical, data_path, metadata_path, report_path, state_path):
+    source_stat = os.stat(filepath)
+    report = new_quality_report()
+    # Only the bytes there were when the file was looked at, so the state
+    # below covers exactly the rows cleaned.
+    with open(filepath, 'rb') as source_file:
+        with stage("read_csv") as timing:
+            raw_data = read_survey_csv(open_byte_range(source_file, 0, source_stat.st_size))
+            timing.rows = len(raw_data)
+        # Rows appended to a file that ends with a whole line can later be
+        # cleaned on their own (see append_to_cache).
+        appendable = ends_with_newline(source_file, source_stat.st_size)
+        digest = cleaned_bytes_digest(source_file, source_stat.st_size) if appendable else None
+    value_counts = count_values(raw_data) if appendable else None
+    cleaned_data, invalid_counts = clean_survey_data(raw_data, categorical, report)
+
+    with replacing(data_path) as temporary_path:
+        cleaned_data.to_feather(temporary_path)
+    write_quality_report(report, report_path)
+    if appendable:
+        mode_values, inconsistent_columns = plan_cleaning(value_counts)
+        write_state(state_path, cleaning_state(value_counts, source_stat.st_size, digest, inconsistent_columns,
+                                               imputed_columns(invalid_counts, mode_values, inconsistent_columns)))
+    elif os.path.exists(state_path):
+        os.remove(state_path)
+    write_cache_metadata(metadata_path, source_metadata(filepath, source_stat, categorical))
+
+    return cleaned_data
+
+
+# Cleans only the rows appended to the file since the cache was written, and
+# appends them to the cached frame; None when the whole file has to be
+# cleaned again instead.
+def append_to_cache(filepath, categorical, data_path, metadata_path, report_path, state_path, cleaned_data=None):
+    state = read_state(state_path)
+    if state is None:
+        return None
+    source_stat = os.stat(filepath)
+    with open(filepath, 'rb') as source_file:
+        if not ends_with_newline(source_file, source_stat.st_size):
+            return None
+
+    report = new_quality_report()
+    appended = clean_appended_rows(filepath, state, categorical, report, end=source_stat.st_size)
+    if appended is None:
+        print(f"{filepath} changed before the last cleaned row: cleaning all of it again")
+        return None
+    cleaned_rows, new_state = appended
+    # Earlier rows were imputed with modes the new rows have moved, so only a
+    # full cleaning gives the same data.
+    if new_state['stale_columns']:
+        return None
+
+    cleaned_rows_before = state['value_counts']['rows']
+    if cleaned_data is None or len(cleaned_data) != cleaned_rows_before:
+        try:
+            cleaned_data = pd.read_feather(data_path)
+        except OSError:
+            return None
+    previous_report = read_quality_report(report_path)
+    if len(cleaned_data) != cleaned_rows_before or previous_report is None or previous_report['rows'] != cleaned_rows_before:
+        return None
+
+    if cleaned_rows is not None:
+        cleaned_data = append_to_frame(cleaned_data, cleaned_rows)
+        with replacing(data_path) as temporary_path:
+            cleaned_data.to_feather(temporary_path)
+        write_quality_report(merge_quality_reports([previous_report, report]), report_path)
+        print(f"Appended {len(cleaned_rows)} new rows of {filepath} to the cleaned data")
+    write_state(state_path, new_state)
+    write_cache_metadata(metadata_path, source_metadata(filepath, source_stat, categorical))
+    return cleaned_data
+
+
+# loaded_data is the frame last loaded from this cache, if any: new rows of
+# the file are appended to it rather than to a copy read from the cache.
+def load_cleaned_data_cached(filepath, cache_dir, categorical=False, loaded_data=None):
+    data_path, metadata_path = cache_paths(filepath, cache_dir, categorical)
+    report_path = quality_report_path(filepath, cache_dir, categorical)
+    state_path = incremental_state_path(filepath, cache_dir, categorical)
+
+    cleaned_data = read_valid_cache(filepath, data_path, metadata_path, report_path)
+    if cleaned_data is not None:
+        return cleaned_data
+
+    # One process rebuilds; others arriving meanwhile wait, then read its result.
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(data_path + ".lock"):
+        cleaned_data = read_valid_cache(filepath, data_path, metadata_path, report_path)
+        if cleaned_data is None:
+            cleaned_data = append_to_cache(filepath, categorical, data_path, metadata_path, report_path, state_path, loaded_data)
+        if cleaned_data is None:
+            cleaned_data = rebuild_cache(filepath, categorical, data_path, metadata_path, report_path, state_path)
+    return cleaned_data
@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+default_datasets = {
+    'Training survey': {'path': 'data/training.csv', 'cache_dir': 'data/cache'},
+}
+
+
+def dataset_slug(name):
+    return re.sub(r'[^a-z0-9.]+', '-', name.lower()).strip('-')
+
+
+# The registry is a JSON object of dataset name -> CSV path, or -> {"path",
+# "cache_dir"}. Each dataset gets a cache directory of its own, so waves that
+# share a file name do not overwrite each other's cleaned data.
+def read_datasets(registry_path, cache_dir):
+    if not registry_path:
+        return dict(default_datasets)
+
+    with open(registry_path) as registry_file:
+        registry = json.load(registry_file)
+    datasets = {}
+    for name, dataset in registry.items():
+        if isinstance(dataset, str):
+            dataset = {'path': dataset}
+        datasets[name] = {'path': dataset['path'],
+                          'cache_dir': dataset.get('cache_dir', os.path.join(cache_dir, dataset_slug(name)))}
+    if not datasets:
+        raise ValueError(f"{registry_path} registers no datasets")
+    return datasets
+
+
+def data_size(value):
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(data_size(key) + data_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(data_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LoadedDatasets:
+    # Keeps the most recently used datasets loaded while their total size
+    # fits the budget. The dataset in use is never evicted, even on its own
+    # over the budget; requests still holding an evicted dataset finish with it.
+    def __init__(self, stores, memory_budget):
+        self.stores = stores
+        self.memory_budget = memory_budget
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        store = self.stores[name]
+        data = store.get()
+        with self.lock:
+            self.loaded[name] = store
+            self.loaded.move_to_end(name)
+            self.evict()
+        return data
+
+    def evict(self):
+        while len(self.loaded) > 1 and sum(store.size for store in self.loaded.values()) > self.memory_budget:
+            name, store = self.loaded.popitem(last=False)
+            store.unload()
+            print(f"Unloaded dataset {name} to stay within the memory budget")
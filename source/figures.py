@@ -0,0 +1,164 @@
+import plotly.express as px
+
+from aggregates import classification_column, lookup_counts
+from query import count_by
+from sampling import estimate_by, margin_column
+from spatial import clusters_within, default_map_center, default_map_zoom
+
+
+# Counts estimated from the sample (see sampling.py) carry margins of error,
+# drawn as error bars; exact counts have none.
+def margins_of(data):
+    return margin_column if margin_column in data else None
+
+
+def mark_estimate(figure, aggregates):
+    design = aggregates.get('sample')
+    if design is not None:
+        figure.update_layout(title_text=f"{figure.layout.title.text or ''}<br><sup>Estimated from a sample of "
+                                        f"{design['rows']} of {design['population']} users, with 95% confidence intervals</sup>")
+    return figure
+
+
+def age_figure(aggregates, selected_category):
+    grouped_data = lookup_counts(aggregates, 'Age', selected_category)
+    age_chart = px.scatter(grouped_data, x='Age', y='User Count', color='Mobile money classification', error_y=margins_of(grouped_data),
+                           title=f"Number of Users per Age Group for the <br>Mobile Money Classification: '{selected_category}'",
+                           labels={'Age': 'Age of users', 'User Count': 'Number of Users', 'Mobile money classification': 'Mobile Money Classification'})
+    age_chart.update_layout(legend_title_text='Mobile Money Classification',
+                            title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
+                            xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                            yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                            legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    age_chart.update_traces(hovertemplate='Age: %{x}<br>Number of Users: %{y}')
+    return age_chart
+
+
+def gender_figure(aggregates, gender_category):
+    gender_data = lookup_counts(aggregates, 'Gender', gender_category)
+    gender_pie_chart = px.pie(gender_data, names='Gender', values='User Count',
+                              title=f"Gender Distribution for the Mobile Money Classification: '{gender_category}'")
+    gender_pie_chart.update_layout(legend_title_text='Gender',
+                                   title={'font': {'size': 20, 'family': 'Arial', 'weight': 'bold'}},
+                                   legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    gender_pie_chart.update_traces(hovertemplate='Gender: %{label}<extra></extra>')
+    return gender_pie_chart
+
+
+def marital_figure(aggregates, marital_category):
+    marital_data = lookup_counts(aggregates, 'Marital status', marital_category)
+    marital_pie_chart = px.pie(marital_data, names='Marital status', values='User Count',
+                               title=f"Marital Status Distribution for the Mobile Money Classification: '{marital_category}'")
+    marital_pie_chart.update_layout(legend_title_text='Marital Status',
+                                    title={'font': {'size': 20, 'family': 'Arial', 'weight': 'bold'}},
+                                    legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    marital_pie_chart.update_traces(hovertemplate='Marital Status: %{label}<extra></extra>')
+    return marital_pie_chart
+
+
+def land_ownership_figure(aggregates, land_ownership_category):
+    grouped_land_data = lookup_counts(aggregates, 'Ownership of land/plot', land_ownership_category)
+    land_ownership_bar = px.bar(grouped_land_data, x='Ownership of land/plot', y='User Count', color='Mobile money classification',
+                                error_y=margins_of(grouped_land_data),
+                                title=f"Land Ownership Distribution for the <br>Mobile Money Classification: '{land_ownership_category}' ",
+                                labels={'Ownership of land/plot': 'Land Ownership', 'User Count': 'Number of Users', 'Mobile money classification': 'Mobile Money Classification'})
+    land_ownership_bar.update_layout(title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
+                                    xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                                    yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                                    legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    land_ownership_bar.update_traces(hovertemplate='Land status: %{label}<extra></extra>')
+    return land_ownership_bar
+
+
+def income_category_figure(aggregates, income_category):
+    grouped_income_data_transposed = aggregates['income_totals']
+    income_margins = aggregates.get('income_margins')
+    income_category_bar = px.bar(grouped_income_data_transposed, x='index', y=income_category,
+                                 error_y=income_margins[income_category] if income_margins is not None else None,
+                                 title=f"Income Category Distribution for the <br>Mobile Money Classification:'{income_category}'",
+                                 labels={'index': 'Income Category', income_category: 'Number of Users'})
+    income_category_bar.update_layout(legend_title_text='Mobile Money Classification',
+                                      title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
+                                      xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                                      yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                                      legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    income_category_bar.update_traces(hovertemplate='Income catergory: %{x}<br>Number of users: %{y}')
+    return income_category_bar
+
+
+def income_map_figure(aggregates, selected_income_column, cell_size=None, bounds=None):
+    if cell_size is not None:
+        return income_cluster_map_figure(aggregates, selected_income_column, cell_size, bounds)
+
+    income_filtered_data = aggregates['map_points'][selected_income_column]
+    income_map_distribution = px.scatter_mapbox(
+        income_filtered_data,
+        lat='Latitude',
+        lon='Longitude',
+        color='Mobile money classification',
+        mapbox_style="carto-positron",
+        zoom=default_map_zoom,
+        center=default_map_center,
+        title=f"Income Distribution for {selected_income_column}"
+    )
+    # Each trace is one classification, so the hover reads it from the trace
+    # name rather than from a per-point text array.
+    income_map_distribution.update_traces(hovertemplate='Mobile Money Classification: %{fullData.name}<extra></extra>',
+                                          marker=dict(size=8.5, opacity=0.7))
+    income_map_distribution.update_layout(legend_title_text='Mobile Money Classification',
+                                          margin={"r":0,"t":0,"l":0,"b":0},
+                                          legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}})
+    return income_map_distribution
+
+
+def income_cluster_map_figure(aggregates, selected_income_column, cell_size, bounds=None):
+    cluster_data = aggregates['map_clusters'][(cell_size, selected_income_column)]
+    if bounds is not None:
+        cluster_data = clusters_within(cluster_data, bounds)
+    income_map_distribution = px.scatter_mapbox(
+        cluster_data,
+        lat='Latitude',
+        lon='Longitude',
+        color='Mobile money classification',
+        size='User Count',
+        size_max=25,
+        mapbox_style="carto-positron",
+        zoom=default_map_zoom,
+        center=default_map_center,
+        title=f"Income Distribution for {selected_income_column}"
+    )
+    income_map_distribution.update_traces(hovertemplate='Mobile Money Classification: %{fullData.name}<br>Number of Users: %{marker.size}<extra></extra>',
+                                          marker=dict(opacity=0.7))
+    # The same uirevision for every income column keeps the user's view when
+    # the column changes, so the grid chosen for its zoom still fits it.
+    income_map_distribution.update_layout(legend_title_text='Mobile Money Classification',
+                                          margin={"r":0,"t":0,"l":0,"b":0},
+                                          legend_title={'font': {'size': 14, 'family': 'Arial', 'weight': 'bold'}},
+                                          uirevision='income-map')
+    return income_map_distribution
+
+
+def cross_filter_figure(aggregates, filters):
+    if 'sample' in aggregates:
+        classification_counts = estimate_by(aggregates['query_index'], filters, classification_column, aggregates['sample'])
+    else:
+        classification_counts = count_by(aggregates['query_index'], filters, classification_column)
+    cross_filter_bar = px.bar(classification_counts, x=classification_column, y='User Count', error_y=margins_of(classification_counts),
+                              title=f"Users Matching the Selected Filters: {classification_counts['User Count'].sum():.0f}",
+                              labels={classification_column: 'Mobile Money Classification', 'User Count': 'Number of Users'})
+    cross_filter_bar.update_layout(title={'font': {'size': 24, 'family': 'Arial', 'weight': 'bold'}},
+                                   xaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}},
+                                   yaxis_title={'font': {'size': 18, 'family': 'Arial', 'weight': 'bold'}})
+    cross_filter_bar.update_traces(hovertemplate='Mobile Money Classification: %{x}<br>Number of Users: %{y}<extra></extra>')
+    return cross_filter_bar
+
+
+figure_builders = {
+    'financial-service-age-graph': age_figure,
+    'pie-chart-by-gender': gender_figure,
+    'pie-chart-by-marital': marital_figure,
+    'land-owned-bar-graph': land_ownership_figure,
+    'income-category-bar-graph': income_category_figure,
+    'income-choropleth-map': income_map_figure,
+    'cross-filter-graph': cross_filter_figure,
+}
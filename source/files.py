@@ -0,0 +1,95 @@
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def temporary_path_for(path):
+    # A temporary file of its own for every writer, in the target's
+    # directory so the final os.replace stays on one file system.
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp', delete=False) as temporary_file:
+        return temporary_file.name
+
+
+@contextmanager
+def replacing(path):
+    # Yields a temporary path to write; the finished file then replaces
+    # path in one step, so readers never see a partial file.
+    temporary_path = temporary_path_for(path)
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(lock_path):
+    # Held by one process at a time across the machine. Without fcntl
+    # (Windows) there is no lock, and concurrent writers only repeat work.
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def complete_lines_end(filepath):
+    # Only whole lines are cleaned, so a row still being written is picked
+    # up by the next run.
+    with open(filepath, 'rb') as source_file:
+        source_file.seek(0, os.SEEK_END)
+        position = source_file.tell()
+        while position > 0:
+            block_start = max(0, position - (1 << 16))
+            source_file.seek(block_start)
+            block = source_file.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+    return 0
+
+
+class ByteRangeReader(io.RawIOBase):
+    def __init__(self, source_file, byte_count):
+        self.source_file = source_file
+        self.remaining = byte_count
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size == 0:
+            return 0
+        read_count = self.source_file.readinto(memoryview(buffer)[:size])
+        self.remaining -= read_count
+        return read_count
+
+
+def open_byte_range(source_file, start, end):
+    source_file.seek(start)
+    return io.BufferedReader(ByteRangeReader(source_file, end - start))
+
+
+def next_line_start(source_file, position):
+    # The first line starting at or after position.
+    if position == 0:
+        return 0
+    source_file.seek(position - 1)
+    source_file.readline()
+    return source_file.tell()
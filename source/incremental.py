@@ -0,0 +1,189 @@
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+from files import complete_lines_end, open_byte_range
+from processing import cleaning_rules_version
+from schema import narrow_frame
+from streaming import clean_chunk, count_values, count_values_in_chunks, merge_value_counts, plan_cleaning, read_dtypes
+
+default_chunksize = 100_000
+
+
+def read_state(state_path):
+    try:
+        with open(state_path, 'rb') as state_file:
+            state = pickle.load(state_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if state.get('rules_version') != cleaning_rules_version():
+        return None
+    return state
+
+
+def write_state(state_path, state):
+    temporary_path = state_path + ".tmp"
+    with open(temporary_path, 'wb') as state_file:
+        pickle.dump(state, state_file)
+    os.replace(temporary_path, state_path)
+
+
+def cleaned_bytes_digest(source_file, byte_offset, window=1 << 16):
+    # The header and the bytes just before byte_offset, enough to tell a file
+    # that was only appended to from one that was rewritten, without reading
+    # all of it.
+    source_file.seek(0)
+    digest = hashlib.sha256(source_file.readline())
+    source_file.seek(max(0, byte_offset - window))
+    digest.update(source_file.read(byte_offset - source_file.tell()))
+    return digest.hexdigest()
+
+
+def imputed_columns(invalid_counts, mode_values, inconsistent_columns):
+    return {column: mode_values[column] for column, count in invalid_counts.items()
+            if count and column not in inconsistent_columns}
+
+
+def rebuild_cleaned_data(filepath, cleaned_path, state_path, chunksize=default_chunksize):
+    end = complete_lines_end(filepath)
+
+    with open(filepath, 'rb') as source_file:
+        value_counts = count_values_in_chunks(open_byte_range(source_file, 0, end), chunksize)
+        mode_values, inconsistent_columns = plan_cleaning(value_counts)
+
+        imputations = {}
+        chunks = pd.read_csv(open_byte_range(source_file, 0, end), sep=",", chunksize=chunksize,
+                             dtype=read_dtypes(value_counts))
+        for chunk_number, chunk in enumerate(chunks):
+            cleaned_chunk, invalid_counts = clean_chunk(chunk, mode_values, inconsistent_columns, return_invalid_counts=True)
+            imputations.update(imputed_columns(invalid_counts, mode_values, inconsistent_columns))
+            cleaned_chunk.to_csv(cleaned_path, index=False, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
+        digest = cleaned_bytes_digest(source_file, end)
+
+    state = cleaning_state(value_counts, end, digest, inconsistent_columns, imputations)
+    write_state(state_path, state)
+    return state
+
+
+def cleaning_state(value_counts, byte_offset, digest, inconsistent_columns, imputations):
+    return {
+        'rules_version': cleaning_rules_version(),
+        'header': list(value_counts['dtypes']),
+        'byte_offset': byte_offset,
+        'cleaned_bytes_digest': digest,
+        'value_counts': value_counts,
+        'inconsistent_columns': inconsistent_columns,
+        'imputations': imputations,
+        'stale_columns': set(),
+    }
+
+
+# The rows appended to filepath since state was saved, cleaned, and the state
+# that covers them: (None, state) if there are none, and None if the file was
+# changed before the last cleaned row.
+def clean_appended_rows(filepath, state, categorical=False, report=None, end=None):
+    if end is None:
+        end = complete_lines_end(filepath)
+    with open(filepath, 'rb') as source_file:
+        if end < state['byte_offset'] or cleaned_bytes_digest(source_file, state['byte_offset']) != state.get('cleaned_bytes_digest'):
+            return None
+        if end == state['byte_offset']:
+            return None, state
+
+        new_rows = pd.read_csv(open_byte_range(source_file, state['byte_offset'], end), sep=",", header=None,
+                               names=state['header'])
+        digest = cleaned_bytes_digest(source_file, end)
+
+    # Parsing straight into narrow dtypes would wrap values that overflow
+    # them, and the first pass's integer dtypes cannot hold a blank answer,
+    # so the new rows are read with inferred dtypes and narrowed on their own
+    # values.
+    value_counts = merge_value_counts(state['value_counts'], count_values(new_rows))
+    new_rows = narrow_frame(new_rows)
+
+    # The modes and the Q9 consistency decision now cover the new rows too.
+    mode_values, inconsistent_columns = plan_cleaning(value_counts)
+
+    cleaned_rows, invalid_counts = clean_chunk(new_rows, mode_values, inconsistent_columns, categorical,
+                                               return_invalid_counts=True, report=report)
+
+    # Rows cleaned earlier were imputed with the modes of that time; if a mode
+    # has moved, or a consistency decision flipped, they need recomputing.
+    stale_columns = set(state['stale_columns'])
+    for column, mode_value in state['imputations'].items():
+        if mode_values[column] != mode_value:
+            stale_columns.add(column)
+    stale_columns.update(inconsistent_columns ^ state['inconsistent_columns'])
+
+    imputations = dict(state['imputations'])
+    imputations.update(imputed_columns(invalid_counts, mode_values, inconsistent_columns))
+
+    return cleaned_rows, {
+        **state,
+        'byte_offset': end,
+        'cleaned_bytes_digest': digest,
+        'value_counts': value_counts,
+        'inconsistent_columns': inconsistent_columns,
+        'imputations': imputations,
+        'stale_columns': stale_columns,
+    }
+
+
+def append_new_rows(filepath, cleaned_path, state_path, categorical=False):
+    state = read_state(state_path)
+    if state is None:
+        rebuild_cleaned_data(filepath, cleaned_path, state_path)
+        return None, set()
+
+    appended = clean_appended_rows(filepath, state, categorical)
+    if appended is None:
+        print(f"{filepath} changed before the last cleaned row: cleaning all of it again")
+        rebuild_cleaned_data(filepath, cleaned_path, state_path)
+        return None, set()
+    cleaned_rows, state = appended
+    if cleaned_rows is None:
+        return None, state['stale_columns']
+
+    cleaned_rows.to_csv(cleaned_path, index=False, mode='a', header=False)
+    write_state(state_path, state)
+    return cleaned_rows, state['stale_columns']
+
+
+def append_to_frame(cleaned_data, cleaned_rows):
+    cleaned_rows = cleaned_rows.copy()
+    cleaned_rows.index = pd.RangeIndex(len(cleaned_data), len(cleaned_data) + len(cleaned_rows))
+    cleaned_data = cleaned_data.copy(deep=False)
+
+    # Categorical columns only concatenate as categoricals with the same
+    # categories; the new rows may hold values the frame has not seen.
+    for column in cleaned_data.columns:
+        if isinstance(cleaned_data[column].dtype, pd.CategoricalDtype):
+            categories = cleaned_data[column].cat.categories.union(cleaned_rows[column].cat.categories, sort=False)
+            cleaned_data[column] = cleaned_data[column].cat.set_categories(categories)
+            cleaned_rows[column] = cleaned_rows[column].cat.set_categories(categories)
+
+    return pd.concat([cleaned_data, cleaned_rows])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clean the rows appended to a survey CSV since the last run.")
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--state', required=True, help="File keeping the value counts between runs")
+    parser.add_argument('--rebuild', action='store_true', help="Clean the whole input again")
+    args = parser.parse_args()
+
+    pd.set_option('future.no_silent_downcasting', True)
+    if args.rebuild:
+        rebuild_cleaned_data(args.input, args.output, args.state)
+        print(f"Cleaned data saved to {args.output}")
+    else:
+        cleaned_rows, stale_columns = append_new_rows(args.input, args.output, args.state)
+        if cleaned_rows is not None:
+            print(f"Appended {len(cleaned_rows)} cleaned rows to {args.output}")
+        if stale_columns:
+            print(f"Modes changed for {', '.join(sorted(stale_columns))}: run with --rebuild to recompute earlier rows")
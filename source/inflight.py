@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import Future
+
+from dash import DiskcacheManager
+
+
+class SingleFlight:
+    # Concurrent calls with the same key wait for the first one and share its
+    # result instead of each doing the work.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        else:
+            call.set_result(result)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return result
+
+
+class SharedJobDiskcacheManager(DiskcacheManager):
+    # Dash keys a background job's result by a hash of its inputs, so a
+    # request with the same inputs as a running job can poll that job's result
+    # instead of starting another process. The job and the number of requests
+    # waiting on it are kept in the cache, so gunicorn workers share them too.
+    def call_job_fn(self, key, job_fn, args, context):
+        import diskcache
+
+        with diskcache.Lock(self.handle, f"{key}-job-lock", expire=10):
+            job = self.handle.get(f"{key}-job")
+            if job is not None and self.job_running(job):
+                self.handle.incr(f"job-{job}-requests", default=1)
+                return job
+
+            job = super().call_job_fn(key, job_fn, args, context)
+            self.handle.set(f"{key}-job", job, expire=self.expire)
+            self.handle.set(f"job-{job}-requests", 1, expire=self.expire)
+            return job
+
+    def terminate_job(self, job):
+        # A request cancelling a shared job only stops it once no other
+        # request is waiting for its result.
+        if job is not None and self.handle.decr(f"job-{job}-requests", default=1) > 0:
+            return
+        super().terminate_job(job)
+
+
+def make_background_manager(cache_dir, cache_by, expire):
+    try:
+        import diskcache
+    except ImportError:
+        print("diskcache is not installed, expensive figures are built in the request instead")
+        return None
+    return SharedJobDiskcacheManager(diskcache.Cache(cache_dir), cache_by=[cache_by], expire=expire)
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("dashboard.instrumentation")
+
+enabled = os.environ.get("DASHBOARD_INSTRUMENTATION") == "1"
+stage_stats = {}
+stats_lock = threading.Lock()
+
+
+class Stage:
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.bytes = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_stage(self.name, time.perf_counter() - self.started_at, self.rows, self.bytes)
+        return False
+
+
+class DisabledStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    # Callers may set rows/bytes after the work is done; ignore them.
+    def __setattr__(self, name, value):
+        pass
+
+
+disabled_stage = DisabledStage()
+
+
+def stage(name, rows=None):
+    if not enabled:
+        return disabled_stage
+    return Stage(name, rows)
+
+
+def record_stage(name, seconds, rows=None, size_bytes=None):
+    with stats_lock:
+        stats = stage_stats.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['count'] += 1
+        stats['total_seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['last_seconds'] = seconds
+        if rows is not None:
+            stats['last_rows'] = rows
+        if size_bytes is not None:
+            stats['last_bytes'] = size_bytes
+
+    event = {'stage': name, 'seconds': round(seconds, 6)}
+    if rows is not None:
+        event['rows'] = rows
+    if size_bytes is not None:
+        event['bytes'] = size_bytes
+    logger.info(json.dumps(event))
+
+
+def enable():
+    global enabled
+    enabled = True
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def metrics_snapshot():
+    with stats_lock:
+        stages = {name: dict(stats) for name, stats in stage_stats.items()}
+    for stats in stages.values():
+        stats['mean_seconds'] = stats['total_seconds'] / stats['count']
+    return {'enabled': enabled, 'stages': stages}
+
+
+if enabled:
+    enable()
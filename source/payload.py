@@ -0,0 +1,92 @@
+import base64
+from functools import lru_cache
+
+import numpy as np
+from dash import Patch
+
+# Rounded to about a metre, coordinates fit a float32 without visible loss.
+coordinate_decimals = 5
+coordinate_keys = {'lat', 'lon'}
+array_keys = {'x', 'y', 'lat', 'lon', 'values'}
+integer_dtypes = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+
+
+def encode_array(values, coordinates=False):
+    # plotly.js reads base64 typed arrays ({'dtype', 'bdata'}), which are
+    # several times smaller than JSON number lists.
+    array = np.asarray(values)
+    if array.ndim != 1 or len(array) == 0:
+        return values
+
+    if array.dtype.kind in 'iu':
+        minimum, maximum = array.min(), array.max()
+        dtype = next((dtype for dtype in integer_dtypes
+                      if np.iinfo(dtype).min <= minimum and maximum <= np.iinfo(dtype).max), None)
+        if dtype is None:
+            return values
+        array = array.astype(dtype)
+    elif array.dtype.kind == 'f':
+        if coordinates:
+            array = np.round(array.astype(np.float64), coordinate_decimals).astype(np.float32)
+        else:
+            array = array.astype(np.float64)
+    else:
+        return values
+
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    return {'dtype': array.dtype.str[1:], 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def compact_trace(trace):
+    trace = dict(trace)
+    for key in array_keys & trace.keys():
+        trace[key] = encode_array(trace[key], coordinates=key in coordinate_keys)
+    if isinstance(trace.get('marker'), dict) and 'size' in trace['marker']:
+        trace['marker'] = {**trace['marker'], 'size': encode_array(trace['marker']['size'])}
+    return trace
+
+
+def compact_figure(figure):
+    # The template is the bulk of every layout and never changes, so it is
+    # sent once with the page (see static_figure) instead of with each update.
+    layout = {key: value for key, value in figure['layout'].items() if key != 'template'}
+    return {'data': [compact_trace(trace) for trace in figure['data']], 'layout': layout}
+
+
+@lru_cache(maxsize=None)
+def template_json():
+    import plotly.io as pio
+
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def static_layout(layout):
+    # What every view of a graph shares: all of its layout but the title text.
+    title = {key: value for key, value in layout.get('title', {}).items() if key != 'text'}
+    return {**layout, 'title': title}
+
+
+def static_figure(layout=None, trace_types=None):
+    # Only the template's defaults for the graph's own trace types, so each
+    # graph on the page carries a fraction of the template.
+    template = template_json()
+    if trace_types is not None:
+        template = {**template, 'data': {trace_type: template['data'][trace_type]
+                                         for trace_type in trace_types if trace_type in template['data']}}
+    return {'data': [], 'layout': {**(layout or {}), 'template': template}}
+
+
+def figure_patch(figure, page_static_layout=None, placeholder_layout=None):
+    patch = Patch()
+    patch['data'] = figure['data']
+    # The page holds the graph's static layout, so usually only the title
+    # text changes; a layout that differs anywhere else is sent in full.
+    if page_static_layout is not None and static_layout(figure['layout']) == page_static_layout:
+        patch['layout']['title']['text'] = figure['layout'].get('title', {}).get('text')
+    else:
+        for key, value in figure['layout'].items():
+            patch['layout'][key] = value
+    # Placeholder parts of the page's figure, such as a loading note.
+    for key in (placeholder_layout or {}).keys() - figure['layout'].keys():
+        del patch['layout'][key]
+    return patch
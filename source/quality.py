@@ -0,0 +1,81 @@
+import json
+from html import escape
+
+from files import replacing
+
+id_column = 'ID'
+
+
+# Filled in place by the validation functions, from the same masks they
+# clean with, so the report costs no extra pass over the data.
+def new_quality_report():
+    return {'rows': 0, 'columns': {}, 'inconsistent_answers': {}}
+
+
+def json_value(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def record_invalid_counts(report, invalid_counts, imputed_values):
+    for column, count in invalid_counts.items():
+        column_report = report['columns'].setdefault(column, {'invalid': 0})
+        column_report['invalid'] += count
+        if column in imputed_values:
+            column_report['imputed_value'] = json_value(imputed_values[column])
+
+
+def record_inconsistent_answers(report, column_to_validate, yes_no_column, ids):
+    answers_report = report['inconsistent_answers'].setdefault(
+        column_to_validate, {'depends_on': yes_no_column, 'count': 0, 'ids': []})
+    answers_report['count'] += len(ids)
+    answers_report['ids'].extend(json_value(respondent_id) for respondent_id in ids)
+
+
+def merge_quality_reports(reports):
+    merged_report = new_quality_report()
+    for report in reports:
+        merged_report['rows'] += report['rows']
+        for column, column_report in report['columns'].items():
+            record_invalid_counts(merged_report, {column: column_report['invalid']},
+                                  {column: column_report['imputed_value']} if 'imputed_value' in column_report else {})
+        for column_to_validate, answers_report in report['inconsistent_answers'].items():
+            record_inconsistent_answers(merged_report, column_to_validate, answers_report['depends_on'], answers_report['ids'])
+    return merged_report
+
+
+def write_quality_report(report, report_path):
+    with replacing(report_path) as temporary_path:
+        with open(temporary_path, 'w') as report_file:
+            json.dump(report, report_file, separators=(',', ':'))
+
+
+def read_quality_report(report_path):
+    try:
+        with open(report_path) as report_file:
+            return json.load(report_file)
+    except (OSError, ValueError):
+        return None
+
+
+def quality_report_html(report, schema, shown_ids=50):
+    column_rows = []
+    for column, column_report in report['columns'].items():
+        spec = schema.get(column, {})
+        imputed_value = column_report.get('imputed_value')
+        imputed_label = spec.get('labels', {}).get(imputed_value, imputed_value)
+        column_rows.append(f"<tr><td>{escape(column)}</td><td>{escape(spec.get('name', column))}</td>"
+                           f"<td>{column_report['invalid']}</td><td>{escape(str(imputed_label if imputed_value is not None else ''))}</td></tr>")
+    answer_rows = []
+    for column_to_validate, answers_report in report['inconsistent_answers'].items():
+        ids = ", ".join(str(respondent_id) for respondent_id in answers_report['ids'][:shown_ids])
+        if answers_report['count'] > shown_ids:
+            ids += ", ..."
+        answer_rows.append(f"<tr><td>{escape(column_to_validate)}</td><td>{escape(answers_report['depends_on'])}</td>"
+                           f"<td>{answers_report['count']}</td><td>{escape(ids)}</td></tr>")
+    return ("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Data quality</title>"
+            "<link rel=\"stylesheet\" href=\"/assets/style.css\"></head>\n<body><div class=\"content\">\n"
+            f"<h1>Data quality</h1>\n<p>{report['rows']} rows cleaned. <a href=\"/quality.json\">Full report (JSON)</a></p>\n"
+            "<h2>Invalid answers</h2>\n<table class=\"quality-table\"><tr><th>Column</th><th>Question</th>"
+            "<th>Invalid</th><th>Imputed with</th></tr>\n" + "\n".join(column_rows) + "\n</table>\n"
+            "<h2>Inconsistent answers</h2>\n<table class=\"quality-table\"><tr><th>Column</th><th>Depends on</th>"
+            "<th>Rows</th><th>IDs</th></tr>\n" + "\n".join(answer_rows) + "\n</table>\n</div></body></html>\n")
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+income_source_dimension = 'Income source'
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(bitmap):
+        return int(np.bitwise_count(bitmap).sum())
+
+    def row_popcounts(bitmaps):
+        return np.bitwise_count(bitmaps).sum(axis=1, dtype=np.int64)
+else:
+    byte_bit_counts = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+    def popcount(bitmap):
+        return int(byte_bit_counts[bitmap.view(np.uint8)].sum())
+
+    def row_popcounts(bitmaps):
+        return byte_bit_counts[bitmaps.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def to_bitmap(mask):
+    # 64 respondents to a word: combining filters is a bitwise AND over
+    # len/64 integers and counting them a popcount, whatever the row count.
+    bits = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    return np.pad(bits, (0, -len(bits) % 8)).view(np.uint64)
+
+
+def value_bitmaps(series):
+    series = series.astype('category')
+    codes = series.cat.codes.to_numpy()
+    return {value: to_bitmap(codes == code) for code, value in enumerate(series.cat.categories)}
+
+
+def build_query_index(cleaned_data, dimensions, income_columns):
+    bitmaps = {dimension: value_bitmaps(cleaned_data[dimension]) for dimension in dimensions}
+    bitmaps[income_source_dimension] = {column: to_bitmap(cleaned_data[column] == 'Yes') for column in income_columns}
+    return {
+        'rows': len(cleaned_data),
+        'bitmaps': bitmaps,
+        'all_rows': to_bitmap(np.ones(len(cleaned_data), dtype=bool)),
+    }
+
+
+def select_rows(query_index, filters):
+    # Values of one dimension are alternatives, the dimensions narrow each
+    # other down. A dimension without selected values does not filter.
+    selection = query_index['all_rows']
+    for dimension, values in filters:
+        if not values:
+            continue
+        bitmaps = query_index['bitmaps'][dimension]
+        dimension_selection = np.zeros_like(selection)
+        for value in values:
+            if value in bitmaps:
+                dimension_selection |= bitmaps[value]
+        selection = selection & dimension_selection
+    return selection
+
+
+def count_by(query_index, filters, dimension):
+    selection = select_rows(query_index, filters)
+    counts = {value: popcount(bitmap & selection) for value, bitmap in query_index['bitmaps'][dimension].items()}
+    return pd.Series(counts, name='User Count', dtype='int64').rename_axis(dimension).reset_index()
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import classification_column, count_dimensions, filter_dimensions, map_columns
+from query import build_query_index, row_popcounts, select_rows, value_bitmaps
+from schema import survey_schema
+from spatial import build_map_clusters
+
+respondent_id_column = survey_schema['ID']['name']
+stratum_column = 'Stratum'
+margin_column = 'Margin of Error'
+# Strata are the classifications within each region_cell_size-degree cell,
+# the survey having no region column of its own.
+region_cell_size = 1.0
+min_stratum_sample = 2
+# 16 bytes, as pandas' hash_array requires.
+sample_hash_key = 'survey-sample-v1'
+confidence_z = 1.96
+
+
+def stratify(cleaned_data):
+    keys = [
+        cleaned_data[classification_column],
+        np.floor(cleaned_data['Latitude'] / region_cell_size).rename('region_lat'),
+        np.floor(cleaned_data['Longitude'] / region_cell_size).rename('region_lon'),
+    ]
+    return cleaned_data.groupby(keys, observed=True, dropna=False).ngroup().to_numpy()
+
+
+def stratified_sample(cleaned_data, sample_size):
+    strata = stratify(cleaned_data)
+    population = np.bincount(strata)
+    # Proportional allocation, with at least two rows a stratum so each has
+    # a variance to put into the confidence intervals.
+    fraction = min(1.0, sample_size / len(cleaned_data))
+    allocation = np.minimum(population, np.maximum(np.round(population * fraction), min_stratum_sample)).astype(np.int64)
+
+    # Each stratum keeps the rows whose respondent IDs hash lowest, so the
+    # same data gives the same sample on every load and in every process.
+    ranks = pd.util.hash_array(cleaned_data[respondent_id_column].to_numpy(), hash_key=sample_hash_key)
+    order = np.lexsort((ranks, strata))
+    position_in_stratum = np.arange(len(order)) - np.repeat(np.cumsum(population) - population, population)
+    chosen = np.sort(order[position_in_stratum < allocation[strata[order]]])
+
+    sample = cleaned_data.iloc[chosen].reset_index(drop=True)
+    sample[stratum_column] = strata[chosen]
+    design = {
+        'rows': len(sample),
+        'population': len(cleaned_data),
+        'allocation': allocation,
+        'weights': population / allocation,
+        # Turns a stratum's sample proportion p into the variance of its
+        # estimated total, N^2 (1 - n/N) p (1 - p) / (n - 1).
+        'variance_factors': np.where(allocation > 1,
+                                     population ** 2 * (1 - allocation / population) / np.maximum(allocation - 1, 1), 0.0),
+    }
+    return sample, design
+
+
+def estimate_from_counts(sample_counts, strata, design):
+    proportions = sample_counts / design['allocation'][strata]
+    estimates = sample_counts * design['weights'][strata]
+    variances = design['variance_factors'][strata] * proportions * (1 - proportions)
+    return estimates, variances
+
+
+def estimate_totals(indicators, keys, sample, design):
+    sample_counts = indicators.groupby(keys + [sample[stratum_column]], observed=True).sum()
+    strata = sample_counts.index.get_level_values(stratum_column).to_numpy()[:, None]
+    estimates, variances = estimate_from_counts(sample_counts.to_numpy(), strata, design)
+    levels = list(range(len(keys)))
+    estimates = pd.DataFrame(estimates, index=sample_counts.index, columns=sample_counts.columns)
+    variances = pd.DataFrame(variances, index=sample_counts.index, columns=sample_counts.columns)
+    return (estimates.groupby(level=levels, observed=True).sum().round(),
+            (confidence_z * np.sqrt(variances.groupby(level=levels, observed=True).sum())).round())
+
+
+# The same keys as build_aggregates, estimated from the sample, with the
+# 95% margins of error of the counts alongside. Every figure then works on
+# a sample of fixed size, whatever the size of the survey.
+def build_sample_aggregates(cleaned_data, sample_size, income_columns, grid_resolutions=()):
+    sample, design = stratified_sample(cleaned_data, sample_size)
+
+    counts = {}
+    users = pd.DataFrame({'User Count': np.ones(len(sample), dtype=np.int64)})
+    for dimension in count_dimensions:
+        estimates, margins = estimate_totals(users, [sample[dimension], sample[classification_column]], sample, design)
+        grouped_data = estimates.assign(**{margin_column: margins['User Count']}).reset_index()
+        for classification, group in grouped_data.groupby(classification_column, observed=True):
+            counts[(dimension, classification)] = group.reset_index(drop=True)
+
+    income_data = (sample[income_columns] == 'Yes').astype(int)
+    income_totals, income_margins = estimate_totals(income_data, [sample[classification_column]], sample, design)
+
+    map_points = {}
+    for income_column in income_columns:
+        map_points[income_column] = sample.loc[income_data[income_column] == 1, map_columns].reset_index(drop=True)
+
+    map_clusters = build_map_clusters(sample, income_columns, grid_resolutions, weights=design['weights'][sample[stratum_column]])
+    for clusters in map_clusters.values():
+        clusters['User Count'] = clusters['User Count'].round()
+
+    query_index = build_query_index(sample, filter_dimensions + [classification_column], income_columns)
+    strata_bitmaps = value_bitmaps(sample[stratum_column])
+    query_index['strata'] = np.array(list(strata_bitmaps))
+    query_index['strata_bitmaps'] = np.stack(list(strata_bitmaps.values()))
+
+    return {
+        'counts': counts,
+        'income_totals': income_totals.transpose().reset_index(),
+        'income_margins': income_margins.transpose().reset_index(),
+        'map_points': map_points,
+        'map_clusters': map_clusters,
+        'query_index': query_index,
+        'sample': design,
+    }
+
+
+def estimate_by(query_index, filters, dimension, design):
+    selection = select_rows(query_index, filters)
+    strata_bitmaps = query_index['strata_bitmaps']
+    rows = []
+    for value, bitmap in query_index['bitmaps'][dimension].items():
+        sample_counts = row_popcounts(strata_bitmaps & (bitmap & selection))
+        estimates, variances = estimate_from_counts(sample_counts, query_index['strata'], design)
+        rows.append((value, round(estimates.sum()), round(confidence_z * np.sqrt(variances.sum()))))
+    return pd.DataFrame(rows, columns=[dimension, 'User Count', margin_column])
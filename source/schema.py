@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+default_read_chunksize = 200_000
+
+money_range = list(range(-1, 0)) + list(range(0, 7))
+mobile_money_range = list(range(-1, 0)) + list(range(0, 6))
+employment_type_range = list(range(-1, 0)) + list(range(1, 8))
+selling_things_range = list(range(-1, 0)) + list(range(1, 11))
+providing_service_range = list(range(-1, 0)) + list(range(1, 13))
+
+yes_no_labels = {
+    1: 'Yes',
+    2: 'No'
+}
+yes_no_flag_labels = {
+    1: 'Yes',
+    0: 'No'
+}
+last_time_money_labels = {
+    -1: 'Not applicable',
+    1: 'Yesterday/today',
+    2: 'In the past 7 days',
+    3: 'In the past 30 days',
+    4: 'In the past 90 days',
+    5: 'More than 90 days ago but less than 6 months ago',
+    6: '6 months or longer ago'
+}
+mobile_money_frequency_labels = {
+    -1: 'Not applicable',
+    1: 'Never',
+    2: 'Daily',
+    3: 'Weekly',
+    4: 'Monthly',
+    5: 'Less often than monthly'
+}
+literacy_labels = {
+    1: 'Can read and write',
+    2: 'Can read only',
+    3: 'Can write only',
+    4: 'Can neither read nor write',
+    5: 'Refused to read'
+}
+
+
+def yes_no_flag(name):
+    return {'name': name, 'dtype': 'int8', 'allowed': range(0, 2), 'labels': yes_no_flag_labels}
+
+
+# Raw survey column -> display name, storage dtype, allowed codes (invalid
+# codes are replaced by the column mode), and the labels of the codes.
+# 'depends_on' names a yes/no column: a "yes" needs an answer other than -1
+# (not applicable), a "no" needs exactly -1.
+survey_schema = {
+    'ID': {'name': 'User ID', 'dtype': 'int32'},
+    'Q1': {'name': 'Age', 'dtype': 'int8'},
+    'Q2': {
+        'name': 'Gender',
+        'dtype': 'int8',
+        'labels': {
+            1: 'Male',
+            2: 'Female'
+        },
+    },
+    'Q3': {
+        'name': 'Marital status',
+        'dtype': 'int8',
+        'allowed': range(1, 5),
+        'labels': {
+            1: 'Married',
+            2: 'Divorced',
+            3: 'Widowed',
+            4: 'Single/never married'
+        },
+    },
+    'Q4': {
+        'name': 'Highest level of education completed?',
+        'dtype': 'int8',
+        'allowed': range(1, 8),
+        'labels': {
+            1: 'No formal education',
+            2: 'Some primary',
+            3: 'Primary completed',
+            4: 'Post primary technical training',
+            5: 'Some secondary',
+            6: 'University or other higher education',
+            7: 'Do not know'
+        },
+    },
+    'Q5': {
+        'name': 'Ownership of land/plot',
+        'dtype': 'int8',
+        'allowed': range(1, 7),
+        'labels': {
+            1: 'You personally own the land/plot where you live',
+            2: 'You own the land/plot together with someone else',
+            3: 'A household member owns the land/plot',
+            4: 'The land/plot is rented',
+            5: 'You do not own or rent the land',
+            6: 'Do not know'
+        },
+    },
+    'Q6': {'name': 'Ownership of land with certificates', 'dtype': 'int8', 'allowed': range(1, 3), 'labels': yes_no_labels},
+    'Q7': {'name': 'Ownership of mobile phone', 'dtype': 'int8', 'allowed': range(1, 3), 'labels': yes_no_labels},
+    'Q8_1': yes_no_flag('Salaries/wages'),
+    'Q8_2': yes_no_flag('Trading/selling produce'),
+    'Q8_3': yes_no_flag('Service providing income'),
+    'Q8_4': yes_no_flag('Piece work/Casual labor'),
+    'Q8_5': yes_no_flag('Rental income'),
+    'Q8_6': yes_no_flag('Interest from savings/investments'),
+    'Q8_7': yes_no_flag('Pension'),
+    'Q8_8': yes_no_flag('Social welfare grant'),
+    'Q8_9': yes_no_flag('Receive money from others'),
+    'Q8_10': yes_no_flag('Expenses covered by others'),
+    'Q8_11': yes_no_flag('Other income'),
+    'Q9': {
+        'name': 'Employment type',
+        'dtype': 'int8',
+        'allowed': employment_type_range,
+        'depends_on': 'Q8_1',
+        'labels': {
+            -1: 'Not applicable',
+            1: 'Government',
+            2: 'Private company/business',
+            3: 'Individual who owns his own business',
+            4: 'Small scale farmer',
+            5: 'Commercial farmer',
+            6: 'Work for individual/household e.g. security guard, maid etc.',
+            7: 'Other'
+        },
+    },
+    'Q10': {
+        'name': 'Main items sold',
+        'dtype': 'int8',
+        'allowed': selling_things_range,
+        'labels': {
+            -1: 'Not applicable',
+            1: 'Crops/produce I grow',
+            2: 'Products I get from livestock',
+            3: 'Livestock',
+            4: 'Fish you catch yourself/aquaculture',
+            5: 'Things you buy from others - agricultural products',
+            6: 'Things you buy from others - non-agricultural products',
+            7: 'Things you make (clothes, art, crafts)',
+            8: 'Things you collect from nature (stones, sand, thatch, herbs)',
+            9: 'Things you process (honey, dairy products, flour)',
+            10: 'Other'
+        },
+    },
+    'Q11': {
+        'name': 'Main services provided',
+        'dtype': 'int8',
+        'allowed': providing_service_range,
+        'labels': {
+            -1: 'Not applicable',
+            1: 'Personal services (hairdressers, massage, etc.)',
+            2: 'Telecommunications/IT',
+            3: 'Financial services',
+            4: 'Transport',
+            5: 'Hospitality /Accommodation, restaurants, etc.',
+            6: 'Information/research',
+            7: 'Technical - mechanic, etc.',
+            8: 'Educational/child care',
+            9: 'Health services - traditional healer etc.',
+            10: 'Legal services',
+            11: 'Security',
+            12: 'Other, specify'
+        },
+    },
+    'Q12': {'name': 'Sent money in last 12 months?', 'dtype': 'int8', 'allowed': range(1, 3), 'labels': yes_no_labels},
+    'Q13': {'name': 'Last time sent money', 'dtype': 'int8', 'allowed': money_range, 'labels': last_time_money_labels},
+    'Q14': {'name': 'Received money in last 12 months?', 'dtype': 'int8', 'allowed': range(1, 3), 'labels': yes_no_labels},
+    'Q15': {'name': 'Last time received money', 'dtype': 'int8', 'allowed': money_range, 'labels': last_time_money_labels},
+    'Q16': {
+        'name': 'Frequency of mobile money usage for purchases',
+        'dtype': 'int8',
+        'allowed': mobile_money_range,
+        'labels': mobile_money_frequency_labels,
+    },
+    'Q17': {
+        'name': 'Frequency of mobile money usage for bill payment',
+        'dtype': 'int8',
+        'allowed': mobile_money_range,
+        'labels': mobile_money_frequency_labels,
+    },
+    'Q18': {'name': 'Literacy in Kiswahili', 'dtype': 'int8', 'allowed': range(0, 6), 'labels': literacy_labels},
+    'Q19': {'name': 'Literacy in English', 'dtype': 'int8', 'allowed': range(0, 6), 'labels': literacy_labels},
+    'Latitude': {'name': 'Latitude', 'dtype': 'float32'},
+    'Longitude': {'name': 'Longitude', 'dtype': 'float32'},
+    'mobile_money': yes_no_flag('Use of mobile money'),
+    'savings': yes_no_flag('Savings behavior'),
+    'borrowing': yes_no_flag('Borrowing behavior'),
+    'insurance': yes_no_flag('Insurance ownership'),
+    'mobile_money_classification': {
+        'name': 'Mobile money classification',
+        'dtype': 'int8',
+        'allowed': range(0, 4),
+        'labels': {
+            0: 'Does not use any financial service',
+            1: 'Does not use mobile money',
+            2: 'Uses mobile money only',
+            3: 'Uses both'
+        },
+    },
+}
+
+# The income sources the dashboard charts (all but money received from
+# others) and the mobile money classifications, in survey order.
+income_columns = [spec['name'] for column, spec in survey_schema.items() if column.startswith('Q8_') and column != 'Q8_9']
+financial_services = list(survey_schema['mobile_money_classification']['labels'].values())
+
+
+def column_value_ranges(dataframe):
+    numeric_data = dataframe.select_dtypes('number')
+    return {column: (numeric_data[column].min(), numeric_data[column].max()) for column in numeric_data.columns}
+
+
+def merge_value_ranges(value_ranges, other):
+    return {column: (min(minimum, other[column][0]), max(maximum, other[column][1]))
+            for column, (minimum, maximum) in value_ranges.items() if column in other}
+
+
+def narrow_dtypes(dtypes, value_ranges):
+    narrowed = {}
+    for column, dtype in dtypes.items():
+        dtype = np.dtype(dtype)
+        narrowed[column] = dtype
+        if column not in survey_schema or column not in value_ranges:
+            continue
+
+        schema_dtype = np.dtype(survey_schema[column]['dtype'])
+        minimum, maximum = value_ranges[column]
+        if schema_dtype.kind == 'f' and dtype.kind in 'iuf':
+            narrowed[column] = schema_dtype
+        elif schema_dtype.kind == 'i' and dtype.kind in 'iu' and pd.notna(minimum):
+            limits = np.iinfo(schema_dtype)
+            if limits.min <= minimum and maximum <= limits.max:
+                narrowed[column] = schema_dtype
+    return narrowed
+
+
+def narrow_frame(dataframe):
+    return dataframe.astype(narrow_dtypes(dataframe.dtypes.to_dict(), column_value_ranges(dataframe)))
+
+
+def read_survey_csv(filepath, chunksize=default_read_chunksize):
+    # pandas' parser silently wraps integers that overflow a narrow dtype, so
+    # each chunk is parsed wide and narrowed only where its values fit. Only
+    # one wide chunk is held at a time.
+    chunks = [narrow_frame(chunk) for chunk in pd.read_csv(filepath, sep=",", chunksize=chunksize)]
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,116 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from itertools import repeat
+
+manifest_name = "manifest.json"
+plotlyjs_name = "plotly.min.js"
+
+# Set in each export worker by load_worker_aggregates.
+worker_aggregates = None
+
+
+def snapshot_views(category_graph_ids, financial_services, income_columns, grid_resolutions, default_filters):
+    # (graph id, figure arguments, name) for every view the dropdowns can
+    # select. The cross-filter graph only has its unfiltered view: its
+    # combinations of selections are too many to export.
+    views = [(graph_id, (financial_service,), financial_service)
+             for graph_id in category_graph_ids for financial_service in financial_services]
+    for income_column in income_columns:
+        views.append(('income-choropleth-map', (income_column,), f"{income_column} points"))
+        for _, cell_size in grid_resolutions:
+            views.append(('income-choropleth-map', (income_column, cell_size), f"{income_column} {cell_size}"))
+    views.append(('cross-filter-graph', (default_filters,), "all users"))
+    return views
+
+
+def view_key(graph_id, arguments):
+    return json.dumps([graph_id, *arguments])
+
+
+def view_path(graph_id, name):
+    return f"{graph_id}/{re.sub(r'[^a-z0-9.]+', '-', name.lower()).strip('-')}"
+
+
+def load_worker_aggregates(input_file, cache_dir, income_columns, grid_resolutions):
+    global worker_aggregates
+
+    import pandas as pd
+
+    from aggregates import build_aggregates
+    from cache import load_cleaned_data_cached
+
+    pd.set_option('future.no_silent_downcasting', True)
+    cleaned_data = load_cleaned_data_cached(input_file, cache_dir, categorical=True)
+    worker_aggregates = build_aggregates(cleaned_data, income_columns, grid_resolutions)
+
+
+def render_view(output_dir, view):
+    import plotly.io as pio
+    from plotly.io.json import to_json_plotly
+
+    from figures import figure_builders
+    from payload import compact_figure
+
+    graph_id, arguments, name = view
+    figure = figure_builders[graph_id](worker_aggregates, *arguments)
+    path = view_path(graph_id, name)
+
+    # The JSON keeps the template, so it is a complete figure on its own,
+    # with its arrays already in the compact form the dashboard sends.
+    figure_dict = figure.to_dict()
+    with open(os.path.join(output_dir, f"{path}.json"), 'w') as figure_file:
+        figure_file.write(to_json_plotly({'data': compact_figure(figure_dict)['data'], 'layout': figure_dict['layout']}))
+    pio.write_html(figure, os.path.join(output_dir, f"{path}.html"), include_plotlyjs=f"../{plotlyjs_name}")
+    return path
+
+
+def write_index(output_dir, views, paths):
+    links = [f'<li><a href="{escape(path)}.html">{escape(graph_id)}: {escape(name)}</a></li>'
+             for (graph_id, _, name), path in zip(views, paths)]
+    with open(os.path.join(output_dir, "index.html"), 'w') as index_file:
+        index_file.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Dashboard snapshot</title></head>\n"
+                         "<body><ul>\n" + "\n".join(links) + "\n</ul></body></html>\n")
+
+
+def export_snapshot(output_dir, views, input_file, cache_dir, income_columns, grid_resolutions, workers=None):
+    from plotly.offline import get_plotlyjs
+
+    from cache import load_cleaned_data_cached
+
+    # Bring the cleaned data cache up to date once, so the workers only read it.
+    load_cleaned_data_cached(input_file, cache_dir, categorical=True)
+
+    for graph_id in {graph_id for graph_id, _, _ in views}:
+        os.makedirs(os.path.join(output_dir, graph_id), exist_ok=True)
+    with open(os.path.join(output_dir, plotlyjs_name), 'w') as plotlyjs_file:
+        plotlyjs_file.write(get_plotlyjs())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_worker_aggregates,
+                             initargs=(input_file, cache_dir, income_columns, grid_resolutions)) as executor:
+        paths = list(executor.map(render_view, repeat(output_dir), views))
+
+    write_index(output_dir, views, paths)
+    # Written last, and atomically, so a running dashboard never reloads a
+    # half-written snapshot.
+    manifest = {view_key(graph_id, arguments): f"{path}.json" for (graph_id, arguments, _), path in zip(views, paths)}
+    temporary_path = os.path.join(output_dir, manifest_name + ".tmp")
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temporary_path, os.path.join(output_dir, manifest_name))
+    print(f"Exported {len(views)} views to {output_dir}")
+
+
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, manifest_name)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def read_snapshot_figure(snapshot_dir, manifest, graph_id, arguments):
+    path = manifest.get(view_key(graph_id, arguments))
+    if path is None:
+        return None
+    with open(os.path.join(snapshot_dir, path)) as figure_file:
+        return json.load(figure_file)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+classification_column = 'Mobile money classification'
+
+# (minimum map zoom, grid cell size in degrees): zooming in switches to a
+# finer grid. The number of cells, and so the size of the map payload, is
+# bounded by the grid, not by the number of respondents.
+default_grid_resolutions = [(0, 0.5), (6, 0.25), (7, 0.1), (9, 0.02)]
+default_map_center = {'lat': -6.369028, 'lon': 34.888822}
+default_map_zoom = 5
+# Half the width and height, in pixels, of the largest map view the clusters
+# sent for a view cover.
+max_view_half_size = (1024, 512)
+
+
+# "zoom:cell size" pairs separated by commas, e.g. "0:0.5,6:0.25,7:0.1,9:0.02".
+def read_grid_resolutions(setting):
+    if not setting:
+        return default_grid_resolutions
+
+    grid_resolutions = []
+    for level in setting.split(','):
+        min_zoom, cell_size = level.split(':')
+        if float(cell_size) <= 0:
+            raise ValueError(f"Grid cell size {cell_size} is not positive")
+        grid_resolutions.append((float(min_zoom), float(cell_size)))
+    return sorted(grid_resolutions)
+
+
+# The bounds (west, south, east, north) of the clusters sent for a view.
+# The center is snapped to a quarter of the view size, so pans within that
+# keep the same bounds, and the bounds reach a view size past the snapped
+# center on every side, so they cover the whole view. A degree of latitude
+# spans more pixels than one of longitude, so sizing both by longitude only
+# widens the bounds.
+def view_bounds(center, zoom):
+    degrees_per_pixel = 360 / (512 * 2 ** np.floor(zoom))
+    bounds = []
+    for coordinate, half_size in zip((center['lon'], center['lat']), max_view_half_size):
+        step = half_size * degrees_per_pixel / 4
+        snapped = np.floor(coordinate / step)
+        bounds.append((round(float((snapped - 4) * step), 6), round(float((snapped + 5) * step), 6)))
+    (west, east), (south, north) = bounds
+    return west, south, east, north
+
+
+def clusters_within(clusters, bounds):
+    west, south, east, north = bounds
+    return clusters[clusters['Longitude'].between(west, east) & clusters['Latitude'].between(south, north)]
+
+
+def cell_size_for_zoom(zoom, grid_resolutions):
+    cell_size = grid_resolutions[0][1]
+    for min_zoom, resolution in grid_resolutions:
+        if zoom >= min_zoom:
+            cell_size = resolution
+    return cell_size
+
+
+def build_map_clusters(cleaned_data, income_columns, grid_resolutions, weights=None):
+    income_data = (cleaned_data[income_columns] == 'Yes').astype(int)
+    # Sample weights turn the counts into estimates of the population counts.
+    if weights is not None:
+        income_data = income_data.mul(np.asarray(weights), axis=0)
+    latitude = cleaned_data['Latitude'].to_numpy()
+    longitude = cleaned_data['Longitude'].to_numpy()
+
+    # Per income column: the number of "yes" respondents and the sums of
+    # their coordinates, so every cell gets the centroid of its points.
+    weighted_data = {}
+    for income_column in income_columns:
+        answered_yes = income_data[income_column].to_numpy()
+        weighted_data[('User Count', income_column)] = answered_yes
+        weighted_data[('Latitude', income_column)] = latitude * answered_yes
+        weighted_data[('Longitude', income_column)] = longitude * answered_yes
+    weighted_data = pd.DataFrame(weighted_data)
+
+    clusters = {}
+    for _, cell_size in grid_resolutions:
+        cell_keys = [
+            pd.Series(np.floor(latitude / cell_size).astype(np.int64), name='cell_lat'),
+            pd.Series(np.floor(longitude / cell_size).astype(np.int64), name='cell_lon'),
+            cleaned_data[classification_column].reset_index(drop=True),
+        ]
+        cell_totals = weighted_data.groupby(cell_keys, observed=True).sum()
+
+        for income_column in income_columns:
+            user_counts = cell_totals[('User Count', income_column)]
+            occupied = user_counts > 0
+            clusters[(cell_size, income_column)] = pd.DataFrame({
+                'Latitude': cell_totals.loc[occupied, ('Latitude', income_column)] / user_counts[occupied],
+                'Longitude': cell_totals.loc[occupied, ('Longitude', income_column)] / user_counts[occupied],
+                'User Count': user_counts[occupied],
+            }).reset_index(level=classification_column).reset_index(drop=True)
+
+    return clusters
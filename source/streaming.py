@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+from processing import (apply_validation_rules, dependent_validation_rules, find_inconsistent_answers,
+                        relabel_columns, validation_rules)
+from quality import new_quality_report, write_quality_report
+from schema import column_value_ranges, merge_value_ranges, narrow_dtypes
+
+default_chunksize = 100_000
+
+
+def rule_columns(column_names):
+    return [column_names] if isinstance(column_names, str) else list(column_names)
+
+
+def validated_columns():
+    columns = [column for column_names, _ in validation_rules for column in rule_columns(column_names)]
+    return columns + [column_to_validate for column_to_validate, _, _ in dependent_validation_rules]
+
+
+def allowed_keys(column):
+    for column_names, range_of_keys in validation_rules:
+        if column in rule_columns(column_names):
+            return range_of_keys
+    return None
+
+
+def count_values(dataframe):
+    return {
+        'rows': len(dataframe),
+        'dtypes': dataframe.dtypes.to_dict(),
+        'value_ranges': column_value_ranges(dataframe),
+        'values': {column: dataframe[column].value_counts() for column in validated_columns()},
+        'answer_pairs': {
+            (column_to_validate, yes_no_column): dataframe.value_counts([yes_no_column, column_to_validate], dropna=False)
+            for column_to_validate, yes_no_column, _ in dependent_validation_rules
+        },
+    }
+
+
+def merge_value_counts(value_counts, other):
+    if value_counts is None:
+        return other
+
+    def add(counts, other_counts):
+        return counts.add(other_counts, fill_value=0).astype(np.int64)
+
+    return {
+        'rows': value_counts['rows'] + other['rows'],
+        'dtypes': {column: np.result_type(dtype, other['dtypes'][column]) for column, dtype in value_counts['dtypes'].items()},
+        'value_ranges': merge_value_ranges(value_counts['value_ranges'], other['value_ranges']),
+        'values': {column: add(counts, other['values'][column]) for column, counts in value_counts['values'].items()},
+        'answer_pairs': {key: add(counts, other['answer_pairs'][key]) for key, counts in value_counts['answer_pairs'].items()},
+    }
+
+
+def count_values_in_chunks(filepath, chunksize=default_chunksize):
+    value_counts = None
+    for chunk in pd.read_csv(filepath, sep=",", chunksize=chunksize):
+        value_counts = merge_value_counts(value_counts, count_values(chunk))
+    return value_counts
+
+
+def read_dtypes(value_counts):
+    # The narrowest schema dtypes every value of the file fits in.
+    return narrow_dtypes(value_counts['dtypes'], value_counts['value_ranges'])
+
+
+def mode_from_counts(counts):
+    # Same tie-break as Series.mode()[0]: the smallest of the most common values.
+    return counts.index[counts == counts.max()].min()
+
+
+def plan_cleaning(value_counts):
+    mode_values = {column: mode_from_counts(counts) for column, counts in value_counts['values'].items()}
+
+    inconsistent_columns = set()
+    for column_to_validate, yes_no_column, range_of_answer in dependent_validation_rules:
+        pair_counts = value_counts['answer_pairs'][(column_to_validate, yes_no_column)]
+        answers = pd.Series(pair_counts.index.get_level_values(yes_no_column))
+        dependent_values = pd.Series(pair_counts.index.get_level_values(column_to_validate))
+
+        # The yes/no column is validated first, so judge its imputed values.
+        range_of_keys = allowed_keys(yes_no_column)
+        if range_of_keys is not None:
+            answers = answers.where(answers.isin(range_of_keys), mode_values[yes_no_column])
+
+        inconsistent_mask = find_inconsistent_answers(answers, dependent_values, range_of_answer)
+        if pair_counts.to_numpy()[inconsistent_mask.to_numpy()].sum() > 0:
+            inconsistent_columns.add(column_to_validate)
+
+    return mode_values, inconsistent_columns
+
+
+def clean_chunk(chunk, mode_values, inconsistent_columns, categorical=False, return_invalid_counts=False, report=None):
+    invalid_counts = apply_validation_rules(chunk, mode_values, inconsistent_columns, report)
+    cleaned_chunk = relabel_columns(chunk, categorical)
+
+    if return_invalid_counts:
+        return cleaned_chunk, invalid_counts
+    return cleaned_chunk
+
+
+def clean_csv_in_chunks(filepath, output_path, chunksize=default_chunksize, report_path=None):
+    value_counts = count_values_in_chunks(filepath, chunksize)
+    mode_values, inconsistent_columns = plan_cleaning(value_counts)
+    report = new_quality_report() if report_path is not None else None
+
+    # Read every chunk with the dtypes of the whole file, as the in-memory
+    # path would, so values are validated and formatted the same way.
+    chunks = pd.read_csv(filepath, sep=",", chunksize=chunksize, dtype=read_dtypes(value_counts))
+    for chunk_number, chunk in enumerate(chunks):
+        cleaned_chunk = clean_chunk(chunk, mode_values, inconsistent_columns, report=report)
+        cleaned_chunk.to_csv(output_path, index=False, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0)
+
+    print(f"Cleaned data saved to {output_path}")
+    if report is not None:
+        write_quality_report(report, report_path)
+        print(f"Data-quality report saved to {report_path}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clean a survey CSV chunk by chunk with bounded memory.")
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--chunksize', type=int, default=default_chunksize)
+    parser.add_argument('--report', default=None, help="Also write a data-quality report to this JSON file")
+    args = parser.parse_args()
+
+    pd.set_option('future.no_silent_downcasting', True)
+    clean_csv_in_chunks(args.input, args.output, args.chunksize, args.report)